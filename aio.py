@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import io
+import time
+from main import Parser, Optimizer, set_array_backend, ARRAY_BACKENDS
+from vm import VM, SUSPENDED, compile_code
+from output import OutputSink
+from inputs import InputReader, InputPending, INPUT_CHUNK_SIZE
+
+# Итераций циклов (и выражений верхнего уровня) между возвратами в цикл событий
+SLICE_TICKS = 1000
+
+# Источник чисел для read, которые поступают из асинхронного потока.
+# Числа добавляет feed(); если их не хватает, чтение прерывается
+# InputPending до того, как что-либо прочитано, и VM приостанавливается.
+class AsyncInputReader(InputReader):
+    def __init__(self):
+        self.configure(io.StringIO(), interactive=False)
+        self.partial = ''  # Число, разрезанное границей порции ввода
+        self.eof = False
+
+    def feed(self, data):
+        data = self.partial + data
+        self.partial = ''
+        tokens = data.split()
+        if tokens and not data[-1].isspace():
+            self.partial = tokens.pop()
+        self.tokens = self.tokens[self.position:] + tokens
+        self.position = 0
+
+    # Конец ввода: больше чисел не будет
+    def finish(self):
+        self.feed(self.partial + ' ')
+        self.eof = True
+
+    def need(self, count):
+        if len(self.tokens) - self.position < count and not self.eof:
+            raise InputPending()
+
+    def read_number(self):
+        self.need(1)
+        return super().read_number()
+
+    def read_into(self, target):
+        self.need(len(target))
+        super().read_into(target)
+
+# Программа для исполнения сопрограммами: много запусков одновременно в одном
+# процессе. Выражения верхнего уровня компилируются в байткод VM один раз,
+# циклы в нём заканчиваются OP_LOOP; у каждого запуска свой кадр, вывод и ввод.
+# Запуск исполняет не больше slice_ticks итераций циклов и вызовов функций подряд,
+# затем отдаёт управление циклу событий. budget - наибольшее число итераций за запуск,
+# time_limit - наибольшее время запуска в секундах (None - без ограничения).
+class AsyncProgram:
+    def __init__(self, source, opt_level=0, lexer_mode='fast', slice_ticks=SLICE_TICKS, budget=None, time_limit=None):
+        parser = Parser(io.StringIO(source), lexer_mode)
+        program = Optimizer(opt_level).optimize_program(parser.parse_program())
+        self.symbols = parser.symbols
+        self.statements = [(ast, compile_code(ast, sliced=True)) for ast in program]
+        self.slice_ticks = slice_ticks
+        self.budget = budget
+        self.time_limit = time_limit
+
+    # Исполняет программу: read() - сопрограмма, возвращающая следующую порцию
+    # ввода ('' в конце), write(text) - сопрограмма вывода. Возвращает False,
+    # если программа завершилась ошибкой; ошибка выводится, как в handle_file.
+    async def run(self, read, write, quiet=True):
+        output = OutputSink()
+        output.configure(io.StringIO(), 'exit', quiet)
+        reader = AsyncInputReader()
+        vm = VM(self.symbols.new_frame(), output, reader)
+        deadline = None if self.time_limit is None else time.monotonic() + self.time_limit
+        left = self.budget  # Оставшийся бюджет итераций
+        ticks = self.slice_ticks  # Оставшаяся часть кванта
+        for ast, code in self.statements:
+            output.echo(ast)
+            try:
+                quota = ticks if left is None else min(ticks, left + 1)
+                result = vm.run(code, ticks=quota)
+                while True:
+                    used = quota - vm.ticks
+                    ticks -= used
+                    if left is not None:
+                        left -= used
+                    if result is not SUSPENDED:
+                        break
+                    if left is not None and left < 0:
+                        raise RuntimeError("Iteration budget exceeded")
+                    await write(output.take())
+                    if vm.waiting_input:
+                        data = await self.wait(read(), deadline)
+                        if data:
+                            reader.feed(data)
+                        else:
+                            reader.finish()
+                    else:
+                        await asyncio.sleep(0)
+                        ticks = self.slice_ticks
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise RuntimeError("Time limit exceeded")
+                    quota = ticks if left is None else min(ticks, left + 1)
+                    result = vm.resume(quota)
+            except Exception as e:
+                output.line(f"Error : {e}")
+                output.line(f"AST:  {ast}")
+                await write(output.take())
+                return False
+            # Выражение верхнего уровня тоже расходует итерацию кванта
+            ticks -= 1
+            if ticks <= 0:
+                await write(output.take())
+                await asyncio.sleep(0)
+                ticks = self.slice_ticks
+        await write(output.take())
+        return True
+
+    async def wait(self, awaitable, deadline):
+        if deadline is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise RuntimeError("Time limit exceeded") from None
+
+    # Запуск над соединением: числа для read читаются из него, вывод пишется в него
+    async def serve_connection(self, stream_reader, stream_writer):
+        async def read():
+            return (await stream_reader.read(INPUT_CHUNK_SIZE)).decode('utf-8', 'replace')
+        async def write(text):
+            if text:
+                stream_writer.write(text.encode('utf-8'))
+                await stream_writer.drain()
+        try:
+            await self.run(read, write)
+        except ConnectionError:
+            pass
+        finally:
+            stream_writer.close()
+            try:
+                await stream_writer.wait_closed()
+            except ConnectionError:
+                pass
+
+# Сервер: каждое соединение - отдельный запуск программы
+async def serve(program, host='127.0.0.1', port=0, unix_path=None):
+    if unix_path:
+        server = await asyncio.start_unix_server(program.serve_connection, unix_path)
+    else:
+        server = await asyncio.start_server(program.serve_connection, host, port)
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Сервер программ X3 на asyncio")
+    arg_parser.add_argument("filename", help="файл с программой на X3")
+    arg_parser.add_argument("--host", default='127.0.0.1',
+                            help="адрес для TCP-соединений")
+    arg_parser.add_argument("--port", type=int, default=7300,
+                            help="порт для TCP-соединений")
+    arg_parser.add_argument("--unix", metavar="PATH",
+                            help="слушать Unix-сокет вместо TCP")
+    arg_parser.add_argument("--arrays", choices=ARRAY_BACKENDS, default='array',
+                            help="хранение массивов: модуль array (array) или NumPy (numpy)")
+    arg_parser.add_argument("--opt-level", type=int, choices=(0, 1, 2), default=0,
+                            help="уровень оптимизации AST")
+    arg_parser.add_argument("--slice", type=int, default=SLICE_TICKS,
+                            help="итераций циклов и вызовов функций между переключениями на другие запуски")
+    arg_parser.add_argument("--budget", type=int,
+                            help="наибольшее число итераций циклов и вызовов функций за запуск")
+    arg_parser.add_argument("--time-limit", type=float,
+                            help="наибольшее время одного запуска, в секундах")
+    args = arg_parser.parse_args()
+    if args.slice < 1:
+        arg_parser.error("--slice must be positive")
+    try:
+        set_array_backend(args.arrays)
+    except RuntimeError as e:
+        arg_parser.error(str(e))
+    with open(args.filename, 'r') as file:
+        source = file.read()
+    program = AsyncProgram(source, args.opt_level, slice_ticks=args.slice, budget=args.budget,
+                           time_limit=args.time_limit)
+    try:
+        asyncio.run(serve(program, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,155 @@
+from array import array
+
+# Теги полей арены: младшие FIELD_TAG_BITS бит элемента fields
+FIELD_TAG_BITS = 3
+TAG_NODE = 0    # номер дочернего узла
+TAG_VALUE = 1   # номер значения в values
+TAG_NONE = 2    # None
+TAG_INT = 3     # небольшое целое, записанное прямо в поле
+TAG_NODES = 4   # смещение в items: число узлов, затем их номера
+
+# Целые, которые помещаются в поле вместе с тегом (номера ячеек, операторы, позиции)
+INLINE_INT_LIMIT = 2 ** (31 - FIELD_TAG_BITS)
+
+# Имена всех слотов класса узла, начиная с базового класса
+def slot_names(cls):
+    names = SLOT_NAMES.get(cls)
+    if names is None:
+        names = SLOT_NAMES[cls] = tuple(name for base in reversed(cls.__mro__)
+                                        for name in base.__dict__.get('__slots__', ()))
+    return names
+
+SLOT_NAMES = {}  # Класс -> имена слотов
+
+# Плоская арена узлов AST: вместо объекта на каждый узел - параллельные массивы.
+# Узел i - это класс classes[kinds[i]] и его слоты, записанные подряд в fields
+# начиная с starts[i]; поле - номер дочернего узла, небольшое целое, None или
+# номер значения в общем списке values (числа, строки, имена, функции).
+# Узлы пронумерованы в прямом порядке обхода; узел, общий для нескольких
+# родителей (например, выражения тела у CountedWhileExprAST), записывается один
+# раз, поэтому его номер может быть меньше номера родителя. roots - номера
+# выражений верхнего уровня.
+# Арена строится и разбирается без рекурсии, поэтому подходит для программ любой глубины.
+class NodeArena:
+    def __init__(self):
+        self.classes = []  # Номер класса -> класс узла
+        self.kinds = array('H')
+        self.starts = array('I')
+        self.fields = array('i')
+        self.items = array('i')  # Последовательности узлов (выражения блока)
+        self.values = []
+        self.roots = array('I')
+
+    def __len__(self):
+        return len(self.kinds)
+
+    # Строит арену по списку корней; node_type - базовый класс узлов
+    @classmethod
+    def from_nodes(cls, roots, node_type):
+        arena = cls()
+        numbers = {}  # id(узел) -> номер
+        order = []
+        stack = list(reversed(roots))
+        while stack:
+            node = stack.pop()
+            if id(node) in numbers:
+                continue
+            numbers[id(node)] = len(order)
+            order.append(node)
+            children = []
+            for name in slot_names(type(node)):
+                value = getattr(node, name, None)
+                if isinstance(value, node_type):
+                    children.append(value)
+                elif isinstance(value, (tuple, list)):
+                    children.extend(item for item in value if isinstance(item, node_type))
+            stack.extend(reversed(children))
+        class_numbers = {}
+        value_numbers = {}  # (тип, значение) -> номер: 1, 1.0 и True - разные значения
+        def value_field(value):
+            key = (type(value), value)
+            if key not in value_numbers:
+                value_numbers[key] = len(arena.values)
+                arena.values.append(value)
+            return value_numbers[key] << FIELD_TAG_BITS | TAG_VALUE
+        for node in order:
+            node_class = type(node)
+            if node_class not in class_numbers:
+                class_numbers[node_class] = len(arena.classes)
+                arena.classes.append(node_class)
+            arena.kinds.append(class_numbers[node_class])
+            arena.starts.append(len(arena.fields))
+            for name in slot_names(node_class):
+                value = getattr(node, name, None)
+                if value is None:
+                    field = TAG_NONE
+                elif isinstance(value, node_type):
+                    field = numbers[id(value)] << FIELD_TAG_BITS | TAG_NODE
+                elif isinstance(value, tuple) and all(isinstance(item, node_type) for item in value):
+                    field = len(arena.items) << FIELD_TAG_BITS | TAG_NODES
+                    arena.items.append(len(value))
+                    arena.items.extend(numbers[id(item)] for item in value)
+                elif type(value) is int and -INLINE_INT_LIMIT <= value < INLINE_INT_LIMIT:
+                    field = value << FIELD_TAG_BITS | TAG_INT
+                else:
+                    field = value_field(value)
+                arena.fields.append(field)
+        arena.roots.extend(numbers[id(root)] for root in roots)
+        return arena
+
+    def node_class(self, index):
+        return self.classes[self.kinds[index]]
+
+    # Значение поля name узла index; дочерние узлы - их номера в арене
+    def get(self, index, name):
+        position = self.starts[index] + slot_names(self.node_class(index)).index(name)
+        return self.decode(self.fields[position])
+
+    def decode(self, field):
+        tag = field & (1 << FIELD_TAG_BITS) - 1
+        payload = field >> FIELD_TAG_BITS
+        if tag == TAG_NODE or tag == TAG_INT:
+            return payload
+        if tag == TAG_VALUE:
+            return self.values[payload]
+        if tag == TAG_NODES:
+            return tuple(self.items[payload + 1:payload + 1 + self.items[payload]])
+        return None
+
+    # Номера дочерних узлов в порядке полей
+    def children(self, index):
+        node_class = self.node_class(index)
+        start = self.starts[index]
+        for field in self.fields[start:start + len(slot_names(node_class))]:
+            tag = field & (1 << FIELD_TAG_BITS) - 1
+            if tag == TAG_NODE:
+                yield field >> FIELD_TAG_BITS
+            elif tag == TAG_NODES:
+                yield from self.decode(field)
+
+    # Восстанавливает узлы-объекты; возвращает список корней.
+    # Сначала создаются все узлы, затем заполняются их поля: общий узел
+    # может стоять в арене как раньше, так и позже ссылающегося на него.
+    def to_nodes(self):
+        nodes = []
+        for kind in self.kinds:
+            node_class = self.classes[kind]
+            nodes.append(node_class.__new__(node_class))
+        for index, node in enumerate(nodes):
+            position = self.starts[index]
+            for name in slot_names(type(node)):
+                field = self.fields[position]
+                position += 1
+                tag = field & (1 << FIELD_TAG_BITS) - 1
+                if tag == TAG_NODE:
+                    value = nodes[field >> FIELD_TAG_BITS]
+                elif tag == TAG_NODES:
+                    value = tuple(nodes[item] for item in self.decode(field))
+                else:
+                    value = self.decode(field)
+                setattr(node, name, value)
+        return [nodes[root] for root in self.roots]
+
+    # Размер массивов арены в байтах (без самих значений values)
+    def nbytes(self):
+        return sum(len(part) * part.itemsize for part in (self.kinds, self.starts, self.fields, self.items, self.roots))
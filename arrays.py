@@ -0,0 +1,109 @@
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Массивы X3 хранятся непрерывным буфером по 8 байт на элемент.
+# Все числа X3 вещественные, поэтому тип элементов - double.
+ARRAY_TYPECODE = 'd'
+
+# Доступные способы хранения массивов
+ARRAY_BACKENDS = ('array', 'numpy')
+
+# Текущий способ хранения
+array_backend = 'array'
+
+def set_array_backend(backend):
+    global array_backend
+    if backend not in ARRAY_BACKENDS:
+        raise RuntimeError(f"Unknown array backend: {backend}")
+    if backend == 'numpy' and numpy is None:
+        raise RuntimeError("NumPy is not installed")
+    array_backend = backend
+
+# Создаёт массив из size нулей
+def new_array(size):
+    if array_backend == 'numpy':
+        return numpy.zeros(size)
+    return array(ARRAY_TYPECODE, bytes(8 * size))
+
+# Смещение элемента многомерного массива формы shape в его непрерывном буфере.
+# Элементы лежат построчно (последний индекс меняется быстрее всего); каждый
+# индекс переводится в целое и проверяется по своему измерению.
+def array_offset(shape, indexes):
+    offset = 0
+    for size, index in zip(shape, indexes):
+        index = int(index)
+        if not 0 <= index < size:
+            raise IndexError("Array index out of bounds")
+        offset = offset * size + index
+    return offset
+
+# Встроенные операции над массивами целиком или над их частью.
+# Часть массива задаётся началом start и длиной count (None - до конца массива).
+# Работа выполняется срезами и встроенными функциями Python (или NumPy),
+# без цикла на X3; операции, меняющие массив, возвращают 0.0, как read.
+
+# Границы части массива; выход за пределы массива - ошибка
+def array_range(target, start, count):
+    start = int(start)
+    end = len(target) if count is None else start + int(count)
+    if not 0 <= start <= end <= len(target):
+        raise IndexError("Array index out of bounds")
+    return start, end
+
+def array_sort(target, start, count=None):
+    start, end = array_range(target, start, count)
+    if isinstance(target, array):
+        target[start:end] = array(ARRAY_TYPECODE, sorted(target[start:end]))
+    else:
+        target[start:end].sort()
+    return 0.0
+
+def array_sum(target, start, count=None):
+    start, end = array_range(target, start, count)
+    if isinstance(target, array):
+        return sum(target[start:end], 0.0)
+    return float(target[start:end].sum())
+
+def array_min(target, start, count=None):
+    start, end = array_range(target, start, count)
+    if start == end:
+        raise RuntimeError("Empty array range")
+    return float(min(target[start:end]))
+
+def array_max(target, start, count=None):
+    start, end = array_range(target, start, count)
+    if start == end:
+        raise RuntimeError("Empty array range")
+    return float(max(target[start:end]))
+
+def array_fill(target, start, value, count=None):
+    start, end = array_range(target, start, count)
+    if isinstance(target, array):
+        target[start:end] = array(ARRAY_TYPECODE, [value]) * (end - start)
+    else:
+        target[start:end] = value
+    return 0.0
+
+# Копирует count элементов source начиная с source_start в target начиная с start;
+# по умолчанию - всё от source_start до конца source. Части могут перекрываться.
+def array_copy(target, start, source, source_start, count=None):
+    source_start, source_end = array_range(source, source_start, count)
+    start, end = array_range(target, start, source_end - source_start)
+    target[start:end] = source[source_start:source_end]
+    return 0.0
+
+# Встроенные операции: имя -> (функция, параметры). Параметр 'a' - массив
+# (имя или имя[начало]), передаётся функции двумя значениями: массивом и началом;
+# 'v' - число. Последним необязательным аргументом задаётся длина части.
+ARRAY_BUILTINS = {
+    'sort': (array_sort, 'a'),
+    'sum': (array_sum, 'a'),
+    'min': (array_min, 'a'),
+    'max': (array_max, 'a'),
+    'fill': (array_fill, 'av'),
+    'copy': (array_copy, 'aa'),
+}
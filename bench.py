@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+import argparse
+import io
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import main
+from lexer import *
+from codegen import run_python_code
+from output import output_sink
+from inputs import input_reader
+from arena import NodeArena
+
+# Генераторы нагрузок. Каждый возвращает текст программы на X3 и текст ввода
+# для read; одинаковые size и seed дают одинаковую программу.
+
+# Сортировка пузырьком массива из size случайных чисел, как в examples/test4.X3
+def gen_sort(size, rng):
+    lines = [f"int arr[{size}];"]
+    lines += [f"arr[{i}] = {rng.randint(0, 1000)};" for i in range(size)]
+    lines.append(f"int n = {size};\nint i = 0;\nint j = 0;\nint temp = 0;")
+    lines.append("""while (i < (n - 1)) {
+    j = 0;
+    while (j < (n - i - 1)) {
+        if (arr[j] > arr[j + 1]) {
+            temp = arr[j];
+            arr[j] = arr[j + 1];
+            arr[j + 1] = temp;
+        };
+        j = j + 1;
+    };
+    i = i + 1;
+};
+print arr[0]; endl;
+print arr[n - 1]; endl;""")
+    return "\n".join(lines) + "\n", ""
+
+# Два вложенных цикла по size итераций
+def gen_loops(size, rng):
+    return f"""int n = {size};
+int i = 0;
+int j = 0;
+int s = 0;
+while (i < n) {{
+    j = 0;
+    while (j < n) {{
+        s = s + i * j;
+        j = j + 1;
+    }};
+    i = i + 1;
+}};
+print s; endl;
+""", ""
+
+# Цикл с длинными арифметическими выражениями
+def gen_arithmetic(size, rng):
+    terms = " + ".join(f"(x * {rng.randint(1, 9)} - i / {rng.randint(1, 9)})" for _ in range(8))
+    return f"""int n = {size};
+int i = 1;
+int x = 1;
+int y = 0;
+while (i < n) {{
+    y = {terms};
+    x = (y - x * 7) / (i + 1) + 1;
+    i = i + 1;
+}};
+print x; endl;
+""", ""
+
+# Вывод size чисел
+def gen_print(size, rng):
+    return f"""int n = {size};
+int i = 0;
+while (i < n) {{
+    print i; " "; print i * 2; endl;
+    i = i + 1;
+}};
+""", ""
+
+# Чтение size чисел в массив одной операцией и ещё size чисел по одному
+def gen_read(size, rng):
+    values = " ".join(str(rng.randint(0, 10 ** 6)) for _ in range(2 * size))
+    return f"""int a[{size}];
+read a;
+int n = {size};
+int x = 0;
+int s = 0;
+int i = 0;
+while (i < n) {{
+    read x;
+    s = s + x + a[i];
+    i = i + 1;
+}};
+print s; endl;
+""", values + "\n"
+
+# Рекурсивная функция: числа Фибоначчи, около 1.6 ** size вызовов
+def gen_calls(size, rng):
+    return f"""int fib(n) {{
+    int r = n;
+    if (n >= 2) {{ r = fib(n - 1) + fib(n - 2); }};
+    r;
+}};
+print fib({size}); endl;
+""", ""
+
+# Двумерный массив size x size: заполнение и сумма соседей каждой внутренней клетки
+def gen_grid(size, rng):
+    return f"""int n = {size};
+int g[{size}][{size}];
+int i = 0;
+int j = 0;
+int s = 0;
+while (i < n) {{
+    j = 0;
+    while (j < n) {{
+        g[i][j] = i * 3 + j;
+        j = j + 1;
+    }};
+    i = i + 1;
+}};
+i = 1;
+while (i < n - 1) {{
+    j = 1;
+    while (j < n - 1) {{
+        s = s + g[i - 1][j] + g[i + 1][j] + g[i][j - 1] + g[i][j + 1];
+        j = j + 1;
+    }};
+    i = i + 1;
+}};
+print s; endl;
+""", ""
+
+# Нагрузки: имя -> (генератор, размер при --scale 1)
+WORKLOADS = {
+    'sort': (gen_sort, 200),
+    'loops': (gen_loops, 150),
+    'arithmetic': (gen_arithmetic, 5000),
+    'print': (gen_print, 20000),
+    'read': (gen_read, 20000),
+    'calls': (gen_calls, 18),
+    'grid': (gen_grid, 120),
+}
+
+ENGINES = [*main.ENGINES, 'python']
+
+# Время выполнения run() и пиковая память по tracemalloc (отдельным запуском,
+# так как tracemalloc сильно замедляет выполнение). Из repeat запусков берётся лучший.
+def measure(run, repeat, memory):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, peak
+
+# Результат build() и память, которую он занимает после построения, по tracemalloc
+def retained_memory(build):
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def count_tokens(source, lexer_mode):
+    lexer = main.LEXERS[lexer_mode](io.StringIO(source))
+    count = 0
+    while lexer.get_token() != TOKEN_EOF:
+        count += 1
+    return count
+
+# Замеряет лексер, парсер и исполнение каждым движком на одной нагрузке
+def bench_workload(name, size, engines, repeat, memory, seed):
+    generator = WORKLOADS[name][0]
+    source, input_text = generator(size, random.Random(seed))
+    results = []
+    def record(stage, variant, seconds, peak, **extra):
+        results.append({'workload': name, 'size': size, 'stage': stage, 'variant': variant,
+                        'seconds': seconds, 'peak_bytes': peak, **extra})
+
+    for lexer_mode in main.LEXERS:
+        tokens = count_tokens(source, lexer_mode)
+        seconds, peak = measure(lambda: count_tokens(source, lexer_mode), repeat, memory)
+        record('lex', lexer_mode, seconds, peak, tokens=tokens, tokens_per_second=tokens / seconds)
+        seconds, peak = measure(lambda: main.Parser(io.StringIO(source), lexer_mode).parse_program(), repeat, memory)
+        record('parse', lexer_mode, seconds, peak, tokens=tokens, tokens_per_second=tokens / seconds)
+
+    parser = main.Parser(io.StringIO(source), 'fast')
+    program = parser.parse_program()
+    symbols = parser.symbols
+
+    # Память AST на узел: узлы-объекты и плоская арена; время - перевод из одной формы в другую
+    if memory:
+        _, object_bytes = retained_memory(lambda: main.Parser(io.StringIO(source), 'fast').parse_program())
+        arena, arena_bytes = retained_memory(lambda: NodeArena.from_nodes(program, main.ExprAST))
+    else:
+        arena = NodeArena.from_nodes(program, main.ExprAST)
+        object_bytes = arena_bytes = None
+    nodes = len(arena)
+    seconds, peak = measure(lambda: NodeArena.from_nodes(program, main.ExprAST), repeat, memory)
+    record('ast', 'arena', seconds, peak, nodes=nodes,
+           bytes_per_node=arena_bytes / nodes if memory else None)
+    seconds, peak = measure(arena.to_nodes, repeat, memory)
+    record('ast', 'objects', seconds, peak, nodes=nodes,
+           bytes_per_node=object_bytes / nodes if memory else None)
+    output = io.StringIO()
+    for engine in engines:
+        if engine == 'python':
+            code = compile(main.transpile(program), name, 'exec')
+            def execute():
+                run_python_code(code, symbols.functions)
+        else:
+            def execute():
+                runner = main.ENGINES[engine](symbols.new_frame())
+                for ast in program:
+                    runner.execute(ast)
+        def run():
+            output.seek(0)
+            output.truncate()
+            output_sink.configure(output, 'block', quiet=True)
+            input_reader.configure(io.StringIO(input_text))
+            execute()
+            output_sink.flush()
+        seconds, peak = measure(run, repeat, memory)
+        record('run', engine, seconds, peak, output_bytes=len(output.getvalue()))
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_table(results, stream):
+    print(f"{'workload':<12} {'size':>7} {'stage':<6} {'variant':<8} {'seconds':>10} {'tokens/s':>12} {'peak KiB':>10}"
+          f" {'B/node':>8}", file=stream)
+    for result in results:
+        rate = f"{result['tokens_per_second']:.0f}" if 'tokens_per_second' in result else ""
+        peak = f"{result['peak_bytes'] / 1024:.0f}" if result['peak_bytes'] is not None else ""
+        per_node = f"{result['bytes_per_node']:.1f}" if result.get('bytes_per_node') is not None else ""
+        print(f"{result['workload']:<12} {result['size']:>7} {result['stage']:<6} {result['variant']:<8} "
+              f"{result['seconds']:>10.4f} {rate:>12} {peak:>10} {per_node:>8}", file=stream)
+
+# Сравнивает время с результатами другого запуска; возвращает число замедлений больше threshold
+def compare(results, baseline, threshold, stream):
+    previous = {(r['workload'], r['size'], r['stage'], r['variant']): r for r in baseline['results']}
+    regressions = 0
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:", file=stream)
+    for result in results:
+        old = previous.get((result['workload'], result['size'], result['stage'], result['variant']))
+        if old is None:
+            continue
+        ratio = result['seconds'] / old['seconds']
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  REGRESSION"
+            regressions += 1
+        print(f"{result['workload']:<12} {result['stage']:<6} {result['variant']:<8} "
+              f"{old['seconds']:>10.4f} -> {result['seconds']:>10.4f}  x{ratio:.2f}{mark}", file=stream)
+    return regressions
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Замеры производительности интерпретатора X3")
+    arg_parser.add_argument("--workloads", default=",".join(WORKLOADS),
+                            help=f"нагрузки через запятую: {', '.join(WORKLOADS)}")
+    arg_parser.add_argument("--engines", default=",".join(ENGINES),
+                            help=f"движки через запятую: {', '.join(ENGINES)}")
+    arg_parser.add_argument("--scale", type=float, default=1.0,
+                            help="множитель размера нагрузок")
+    arg_parser.add_argument("--repeat", type=int, default=3,
+                            help="число повторов, берётся лучшее время")
+    arg_parser.add_argument("--seed", type=int, default=1,
+                            help="зерно генератора случайных чисел для нагрузок")
+    arg_parser.add_argument("--no-memory", action="store_true",
+                            help="не измерять пиковую память")
+    arg_parser.add_argument("--json",
+                            help="записать результаты в JSON-файл")
+    arg_parser.add_argument("--compare",
+                            help="JSON-файл прошлого запуска для сравнения")
+    arg_parser.add_argument("--threshold", type=float, default=0.1,
+                            help="допустимое относительное замедление при сравнении")
+    args = arg_parser.parse_args()
+    workloads = args.workloads.split(",")
+    engines = args.engines.split(",")
+    for name in workloads:
+        if name not in WORKLOADS:
+            arg_parser.error(f"unknown workload: {name}")
+    for engine in engines:
+        if engine not in ENGINES:
+            arg_parser.error(f"unknown engine: {engine}")
+
+    results = []
+    for name in workloads:
+        size = max(1, int(WORKLOADS[name][1] * args.scale))
+        results += bench_workload(name, size, engines, args.repeat, not args.no_memory, args.seed)
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': args.scale,
+        'seed': args.seed,
+        'results': results,
+    }
+    print_table(results, sys.stdout)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=1)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold, sys.stdout):
+            sys.exit(1)
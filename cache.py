@@ -0,0 +1,112 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+# Версия интерпретатора. Меняется при изменении классов AST или разбора,
+# чтобы файлы кеша, записанные старой версией, не читались.
+X3_VERSION = '1.13'
+
+# Каталог кеша рядом с файлом программы, как __pycache__ у Python
+CACHE_DIR_NAME = '__x3cache__'
+CACHE_SUFFIX = '.x3c'
+
+# Предельный размер каталога кеша; при превышении удаляются давно не использованные файлы
+CACHE_SIZE_LIMIT = 16 * 1024 * 1024
+
+# Заголовок файла кеша: сигнатура и полный ключ, затем pickle программы
+CACHE_MAGIC = b'X3C\x01'
+
+# Ключ кеша: хеш исходного текста, уровня оптимизации, версии интерпретатора
+# и версии Python (формат pickle и marshal), а также модуля, в котором определены
+# классы AST, и вида записи kind: ast - разобранная программа, python - код Python
+def cache_key(source, opt_level=0, namespace='__main__', kind='ast'):
+    header = f"{X3_VERSION}\n{sys.implementation.cache_tag}\n{namespace}\n{kind}\n{opt_level}\n"
+    return hashlib.sha256((header + source).encode('utf-8')).hexdigest()
+
+# Дисковый кеш разобранных (и оптимизированных) программ.
+# Файл <имя>.<начало ключа>.x3c хранит программу в виде pickle. Повреждённый
+# или устаревший файл считается промахом и удаляется; ошибки записи
+# (например, каталог только для чтения) просто отключают кеширование.
+class ProgramCache:
+    def __init__(self, cache_dir=None, size_limit=CACHE_SIZE_LIMIT):
+        self.cache_dir = cache_dir  # None - каталог __x3cache__ рядом с программой
+        self.size_limit = size_limit
+
+    def directory(self, filename):
+        if self.cache_dir is not None:
+            return self.cache_dir
+        return os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_DIR_NAME)
+
+    def path(self, filename, key):
+        name = os.path.splitext(os.path.basename(filename))[0]
+        return os.path.join(self.directory(filename), f"{name}.{key[:16]}{CACHE_SUFFIX}")
+
+    # Возвращает сохранённое значение или None
+    def load(self, filename, key):
+        path = self.path(filename, key)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return None
+        header = CACHE_MAGIC + key.encode('ascii')
+        try:
+            if not data.startswith(header):
+                raise ValueError("Stale cache file")
+            value = pickle.loads(data[len(header):])
+        except Exception:
+            self.remove(path)
+            return None
+        try:
+            os.utime(path)  # Время изменения служит временем последнего использования
+        except OSError:
+            pass
+        return value
+
+    def store(self, filename, key, value):
+        try:
+            data = CACHE_MAGIC + key.encode('ascii') + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, RecursionError):
+            return
+        directory = self.directory(filename)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Запись во временный файл и переименование: другой процесс
+            # никогда не увидит наполовину записанный файл
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, self.path(filename, key))
+        except OSError:
+            self.remove(temp_path)
+            return
+        self.evict(directory)
+
+    # Удаляет давно не использованные файлы, пока каталог больше size_limit
+    def evict(self, directory):
+        entries = []
+        try:
+            for entry in os.scandir(directory):
+                if entry.name.endswith(CACHE_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.size_limit:
+                break
+            self.remove(path)
+            total -= size
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
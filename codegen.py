@@ -0,0 +1,190 @@
+from lexer import *
+from arrays import new_array, ARRAY_BUILTINS
+from output import output_sink, format_value
+from inputs import input_reader
+from optimizer import loop_trips, bounded_int
+from memo import MISSING
+from trampoline import RECURSION_DEPTH_LIMIT
+
+# Функции времени исполнения, которые вызывает сгенерированный код.
+# Повторяют поведение методов evaluate() соответствующих узлов AST.
+def x3_string(value):
+    output_sink.write(value)
+    return ""
+
+def x3_print(value):
+    output_sink.write(format_value(value))
+    return value
+
+def x3_endl():
+    output_sink.line()
+    return 0.0
+
+def x3_read():
+    return input_reader.read_number()
+
+def x3_read_array(target):
+    input_reader.read_into(target)
+    return 0.0
+
+def x3_div(left, right):
+    if right == 0:
+        raise ZeroDivisionError("Division by zero")
+    return left / right
+
+def x3_bounded_int(value, limit):
+    return bounded_int(value, limit)
+
+def x3_loop_trips(start, bound, op, step):
+    return loop_trips(start, bound, op, step)
+
+def x3_out_of_bounds():
+    raise IndexError("Array index out of bounds")
+
+def x3_new_array(size):
+    return new_array(size)
+
+# Функция pure: вызовы идут через кеш её результатов. Последний аргумент -
+# глубина вызова (см. PythonGenerator.function), в ключ кеша он не входит.
+def x3_memoize(function, cache):
+    def memoized(*args):
+        key = args[:-1]
+        value = cache.get(key)
+        if value is MISSING:
+            value = cache.put(key, function(*args))
+        return value
+    return memoized
+
+def x3_echo(text):
+    output_sink.echo(text)
+
+def x3_error(error, text):
+    output_sink.line(f"Error : {error}")
+    output_sink.line(f"AST:  {text}")
+    return False
+
+# Шаблоны кода Python для бинарных операторов
+PYTHON_OPERATORS = {
+    ord('+'): "({} + {})",
+    ord('-'): "({} - {})",
+    ord('*'): "({} * {})",
+    ord('/'): "x3_div({}, {})",
+    TOKEN_EQ: "({} == {})",
+    TOKEN_NE: "({} != {})",
+    TOKEN_LT: "({} < {})",
+    TOKEN_LE: "({} <= {})",
+    TOKEN_GT: "({} > {})",
+    TOKEN_GE: "({} >= {})",
+}
+
+# Глобальное пространство имён для исполнения сгенерированного кода
+RUNTIME = {name: value for name, value in globals().items() if name.startswith('x3_')}
+# Встроенные операции над массивами вызываются как x3_<имя операции>
+RUNTIME.update((f"x3_{name}", function) for name, (function, _) in ARRAY_BUILTINS.items())
+
+# Имя функции, в которую оборачивается вся программа
+PROGRAM_NAME = 'x3_program'
+
+# Наибольшая глубина AST, которую движок python переводит в код Python:
+# компилятор Python ограничивает вложенность скобок и отступов.
+PYTHON_DEPTH_LIMIT = 50
+
+# Генератор исходного кода Python.
+# Переменные X3 становятся локальными переменными функции программы (v_<имя>),
+# промежуточные значения - временными переменными (_t<номер>), функции X3 -
+# вложенными функциями Python (f_<имя>) со своими локальными переменными.
+class PythonGenerator:
+    def __init__(self):
+        self.lines = []
+        self.indent = 1
+        self.temp_count = 0
+        self.call_depth = "0"  # Глубина вызовов функций X3 из генерируемого кода
+
+    def line(self, text):
+        self.lines.append('    ' * self.indent + text)
+
+    def mark(self):
+        return len(self.lines)
+
+    def temp(self):
+        self.temp_count += 1
+        return f"_t{self.temp_count}"
+
+    # Вычисляет выражение во временную переменную перед строками, начиная с mark.
+    # Нужно, когда следующий операнд порождает операторы, чтобы сохранить порядок вычисления.
+    def hoist(self, mark, expr):
+        temp = self.temp()
+        self.lines.insert(mark, '    ' * self.indent + f"{temp} = {expr}")
+        return temp
+
+    def variable(self, name):
+        return f"v_{name}"
+
+    # Выражение с сокращённым вычислением (op - 'and' или 'or'). Если правый
+    # операнд порождает операторы, они переносятся под if, чтобы выполняться,
+    # только когда правый операнд действительно вычисляется.
+    def short_circuit(self, op, lhs, rhs):
+        left = lhs.to_python(self)
+        mark = self.mark()
+        right = rhs.to_python(self)
+        if self.mark() == mark:
+            return f"({left} {op} {right})"
+        statements = self.lines[mark:]
+        del self.lines[mark:]
+        temp = self.temp()
+        self.line(f"{temp} = {left}")
+        self.line(f"if {'not ' if op == 'or' else ''}{temp}:")
+        self.lines.extend('    ' + statement for statement in statements)
+        self.line(f"    {temp} = {right}")
+        return temp
+
+    # Вложенный блок операторов; пустой блок заполняется pass
+    def body(self, emit):
+        self.indent += 1
+        mark = self.mark()
+        emit()
+        if self.mark() == mark:
+            self.line("pass")
+        self.indent -= 1
+
+    # Объявление функции X3. Кеш функции pure берётся из x3_functions - таблицы
+    # функций программы, которую передаёт run_python_code. Последний параметр
+    # _depth - число вызовов функций X3 над этим: вызов глубже
+    # RECURSION_DEPTH_LIMIT исполняет VM, чей стек вызовов не ограничен
+    # пределом рекурсии Python.
+    def function(self, function):
+        name = f"f_{function.name}"
+        params = [self.variable(param) for param in function.params]
+        self.line(f"def {name}({', '.join([*params, '_depth'])}):")
+        def emit():
+            self.line(f"if _depth > {RECURSION_DEPTH_LIMIT}:")
+            args = ', '.join(params) + (',' if len(params) == 1 else '')
+            self.line(f"    return x3_functions[{function.name!r}].call_vm(({args}))")
+            call_depth = self.call_depth
+            self.call_depth = "_depth + 1"
+            self.line(f"return {function.body.to_python(self)}")
+            self.call_depth = call_depth
+        self.body(emit)
+        if function.cache is not None:
+            self.line(f"{name} = x3_memoize({name}, x3_functions[{function.name!r}].cache)")
+
+    # Выражение верхнего уровня: эхо AST и обработка ошибок, как в handle_file.
+    # Функция программы возвращает False, если выполнение прервано ошибкой.
+    def top_level(self, ast):
+        text = repr(str(ast))
+        self.line(f"x3_echo({text})")
+        self.line("try:")
+        self.body(lambda: ast.to_python_statement(self))
+        self.line("except Exception as error:")
+        self.line(f"    return x3_error(error, {text})")
+
+    def source(self):
+        return "\n".join([f"def {PROGRAM_NAME}():", *self.lines, "    return True", ""])
+
+# functions - таблица функций программы (имя -> Function), нужна функциям pure
+# и слишком глубоким вызовам
+def run_python_code(code, functions=None):
+    namespace = dict(RUNTIME)
+    namespace['x3_functions'] = {} if functions is None else functions
+    exec(code, namespace)
+    return namespace[PROGRAM_NAME]()
@@ -0,0 +1,68 @@
+import sys
+from array import array
+from output import output_sink
+
+# Размер порции, которой читается неинтерактивный ввод
+INPUT_CHUNK_SIZE = 64 * 1024
+
+# Ввода для read пока нет, но он ещё поступит (асинхронный ввод, aio.py)
+class InputPending(Exception):
+    pass
+
+# Источник чисел для read.
+# Ввод читается крупными порциями и сразу делится на числа по пробельным
+# символам, поэтому числа могут стоять по нескольку в строке. С терминала
+# ввод читается построчно, чтобы не ждать конца ввода.
+class InputReader:
+    def __init__(self):
+        self.configure(sys.stdin)
+
+    # interactive - читать построчно; None - только если поток является терминалом
+    def configure(self, stream, interactive=None):
+        self.stream = stream
+        self.interactive = stream.isatty() if interactive is None else interactive
+        self.tokens = []
+        self.position = 0
+
+    # Поток и ещё не прочитанные числа - чтобы вернуть их методом restore
+    def save(self):
+        return dict(vars(self))
+
+    def restore(self, state):
+        vars(self).update(state)
+
+    # Читает следующую порцию ввода, пока в ней не найдётся хотя бы одно число
+    def fill(self):
+        while self.position >= len(self.tokens):
+            if self.interactive:
+                output_sink.flush()  # Приглашение должно быть видно до ввода
+                data = self.stream.readline()
+            else:
+                data = self.stream.read(INPUT_CHUNK_SIZE)
+                if data and not data[-1].isspace():
+                    data += self.stream.readline()  # Дочитывает разрезанное порцией число
+            if not data:
+                raise RuntimeError("Unexpected end of input")
+            self.tokens = data.split()
+            self.position = 0
+
+    def read_number(self):
+        if self.position >= len(self.tokens):
+            self.fill()
+        token = self.tokens[self.position]
+        self.position += 1
+        return float(token)
+
+    # Заполняет массив target числами из ввода
+    def read_into(self, target):
+        filled = 0
+        while filled < len(target):
+            if self.position >= len(self.tokens):
+                self.fill()
+            count = min(len(target) - filled, len(self.tokens) - self.position)
+            chunk = self.tokens[self.position:self.position + count]
+            target[filled:filled + count] = array('d', map(float, chunk))
+            self.position += count
+            filled += count
+
+input_reader = InputReader()
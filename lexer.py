@@ -1,4 +1,7 @@
+import mmap
 import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 
 # Типы токенов
 TOKEN_EOF = -1
@@ -33,6 +36,7 @@ TOKEN_RSQUARE = ord(']')
 TOKEN_COMMA = ord(',')
 TOKEN_INPUT = -23
 TOKEN_COMMENT = -24
+TOKEN_PURE = -25
 
 class Lexer:
     def __init__(self, input_stream):
@@ -41,28 +45,45 @@ class Lexer:
         self.identifier_str = ''  # Строка для хранения идентификаторов
         self.num_val = 0  # Числовое значение токена
         self.string_val = ''  # Строковое значение токена
+        self.char_line = 1  # Строка текущего символа
+        self.char_column = 0  # Столбец текущего символа
+        self.line = 1  # Строка текущего токена
+        self.column = 1  # Столбец текущего токена
+
+    # Читает следующий символ, отслеживая его строку и столбец
+    def read_char(self):
+        if self.current_char == '\n':
+            self.char_line += 1
+            self.char_column = 1
+        else:
+            self.char_column += 1
+        return self.input_stream.read(1)
 
     def get_token(self):
         # Пропуск пробельных символов
         while self.current_char.isspace():
-            self.current_char = self.input_stream.read(1)
+            self.current_char = self.read_char()
             if not self.current_char:
                 return TOKEN_EOF
         
         # Пропуск комментариев
         if self.current_char == '#':
             while self.current_char not in ('\n', '\r', ''):
-                self.current_char = self.input_stream.read(1)
+                self.current_char = self.read_char()
             if self.current_char:
                 return self.get_token()
 
+        # Начало токена
+        self.line = self.char_line
+        self.column = self.char_column
+
         # Обработка идентификаторов и ключевых слов
         if re.match(r'[a-zA-Zа-яА-Я]', self.current_char):
             self.identifier_str = self.current_char
 
             # Считываем идентификатор до конца
             while True:
-                self.current_char = self.input_stream.read(1)
+                self.current_char = self.read_char()
                 if not re.match(r'[a-zA-Z0-9а-яА-Я_]', self.current_char):
                     break
                 self.identifier_str += self.current_char
@@ -80,6 +101,8 @@ class Lexer:
                 return TOKEN_ENDL
             if self.identifier_str == "read":
                 return TOKEN_INPUT
+            if self.identifier_str == "pure":
+                return TOKEN_PURE
             return TOKEN_IDENTIFIER
 
         # Обработка чисел
@@ -87,18 +110,18 @@ class Lexer:
             num_str = ''
             while re.match(r'\d|\.', self.current_char):
                 num_str += self.current_char
-                self.current_char = self.input_stream.read(1)
+                self.current_char = self.read_char()
             self.num_val = float(num_str)
             return TOKEN_NUMBER
 
         # Обработка строковых литералов
         if self.current_char == '\"':
             self.string_val = ''
-            self.current_char = self.input_stream.read(1)
+            self.current_char = self.read_char()
             while self.current_char != '\"' and self.current_char:
                 self.string_val += self.current_char
-                self.current_char = self.input_stream.read(1)
-            self.current_char = self.input_stream.read(1)
+                self.current_char = self.read_char()
+            self.current_char = self.read_char()
             return TOKEN_STRING
 
         # Обработка конца файла
@@ -107,47 +130,47 @@ class Lexer:
 
         # Обработка операторов и разделителей
         if self.current_char == '=':
-            self.current_char = self.input_stream.read(1)
+            self.current_char = self.read_char()
             if self.current_char == '=':
-                self.current_char = self.input_stream.read(1)
+                self.current_char = self.read_char()
                 return TOKEN_EQ
             return TOKEN_ASSIGN
 
         if self.current_char == '!':
-            self.current_char = self.input_stream.read(1)
+            self.current_char = self.read_char()
             if self.current_char == '=':
-                self.current_char = self.input_stream.read(1)
+                self.current_char = self.read_char()
                 return TOKEN_NE
 
         if self.current_char == '<':
-            self.current_char = self.input_stream.read(1)
+            self.current_char = self.read_char()
             if self.current_char == '=':
-                self.current_char = self.input_stream.read(1)
+                self.current_char = self.read_char()
                 return TOKEN_LE
             return TOKEN_LT
 
         if self.current_char == '>':
-            self.current_char = self.input_stream.read(1)
+            self.current_char = self.read_char()
             if self.current_char == '=':
-                self.current_char = self.input_stream.read(1)
+                self.current_char = self.read_char()
                 return TOKEN_GE
             return TOKEN_GT
 
         if self.current_char == '&':
-            self.current_char = self.input_stream.read(1)
+            self.current_char = self.read_char()
             if self.current_char == '&':
-                self.current_char = self.input_stream.read(1)
+                self.current_char = self.read_char()
                 return TOKEN_AND
 
         if self.current_char == '|':
-            self.current_char = self.input_stream.read(1)
+            self.current_char = self.read_char()
             if self.current_char == '|':
-                self.current_char = self.input_stream.read(1)
+                self.current_char = self.read_char()
                 return TOKEN_OR
     
         # Обработка одиночных символов (разделителей)
         single_char = self.current_char
-        self.current_char = self.input_stream.read(1)
+        self.current_char = self.read_char()
 
         return ord(single_char) if single_char in '+-*/(){}[],' else {
             '=': TOKEN_ASSIGN,
@@ -158,3 +181,235 @@ class Lexer:
             '&': TOKEN_AND,
             '|': TOKEN_OR
         }.get(single_char, ord(single_char))
+
+
+# Ключевые слова языка
+KEYWORDS = {
+    'int': TOKEN_INT,
+    'if': TOKEN_IF,
+    'while': TOKEN_WHILE,
+    'print': TOKEN_PRINT,
+    'endl': TOKEN_ENDL,
+    'read': TOKEN_INPUT,
+    'pure': TOKEN_PURE,
+}
+
+# Операторы и разделители, у которых токен отличается от кода символа
+OPERATORS = {
+    '==': TOKEN_EQ,
+    '!=': TOKEN_NE,
+    '<=': TOKEN_LE,
+    '>=': TOKEN_GE,
+    '&&': TOKEN_AND,
+    '||': TOKEN_OR,
+    '=': TOKEN_ASSIGN,
+    ';': TOKEN_SEMI,
+    '<': TOKEN_LT,
+    '>': TOKEN_GT,
+    '!': TOKEN_NE,
+    '&': TOKEN_AND,
+    '|': TOKEN_OR,
+}
+
+# Общее регулярное выражение для всех токенов.
+# Пробелы и комментарии поглощаются вместе со следующим токеном.
+TOKEN_REGEX = re.compile(r'''
+    (?:\s+|\#[^\r\n]*)*
+    (?:
+        (?P<identifier>[a-zA-Zа-яА-Я][a-zA-Z0-9а-яА-Я_]*)
+      | (?P<number>[\d.]+)
+      | (?P<string>"(?P<text>[^"]*)"?)
+      | (?P<operator>==|!=|<=|>=|&&|\|\||.)
+      | (?P<eof>\Z)
+    )
+''', re.VERBOSE | re.DOTALL)
+
+# Разбивает весь текст на токены за один проход общего регулярного выражения.
+# Каждый токен - кортеж (тип, значение, строка, столбец).
+def tokenize(text):
+    line = 1
+    line_start = 0
+    position = 0
+    count_newlines = text.count
+    for match in TOKEN_REGEX.finditer(text):
+        group = match.lastgroup
+        start = match.start(group)
+        # Переводы строк между началом прошлого токена и началом текущего
+        # (включая переводы строк внутри строковых литералов)
+        newlines = count_newlines('\n', position, start)
+        if newlines:
+            line += newlines
+            line_start = text.rindex('\n', position, start) + 1
+        position = start
+        column = start - line_start + 1
+        if group == 'identifier':
+            value = match.group(group)
+            yield (KEYWORDS.get(value, TOKEN_IDENTIFIER), value, line, column)
+        elif group == 'operator':
+            value = match.group(group)
+            yield (OPERATORS.get(value) or ord(value), None, line, column)
+        elif group == 'number':
+            yield (TOKEN_NUMBER, float(match.group(group)), line, column)
+        elif group == 'string':
+            yield (TOKEN_STRING, match.group('text'), line, column)
+        else:
+            yield (TOKEN_EOF, None, line, column)
+            return
+
+# Быстрый лексер: читает весь поток сразу и разбирает его функцией tokenize.
+# Интерфейс совпадает с Lexer, поэтому парсер работает с ним без изменений.
+class FastLexer:
+    def __init__(self, input_stream):
+        self.tokens = tokenize(input_stream.read())
+        self.identifier_str = ''  # Строка для хранения идентификаторов
+        self.num_val = 0  # Числовое значение токена
+        self.string_val = ''  # Строковое значение токена
+        self.line = 1  # Строка текущего токена
+        self.column = 1  # Столбец текущего токена
+
+    def get_token(self):
+        token = next(self.tokens, None)
+        if token is None:
+            return TOKEN_EOF
+        kind, value, self.line, self.column = token
+        if kind == TOKEN_NUMBER:
+            self.num_val = value
+        elif kind == TOKEN_STRING:
+            self.string_val = value
+        elif value is not None:
+            self.identifier_str = value
+        return kind
+
+# Наименьший размер части файла для параллельного лексера; файл меньше
+# PARALLEL_CHUNK_SIZE разбирается в текущем процессе
+PARALLEL_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Строковые литералы и комментарии: внутри них ';' не разделяет выражения
+SKIPPED_REGEX = re.compile(rb'"[^"]*"?|#[^\r\n]*')
+SKIPPED_START_REGEX = re.compile(rb'["#]')
+BOUNDARY_REGEX = re.compile(rb'["#;]')
+
+# Находит границу части: позицию после первой ';' вне строк и комментариев,
+# не раньше target. position - начало предыдущей части (вне строки и комментария).
+# Возвращает len(data), если такой ';' нет.
+def find_boundary(data, position, target):
+    # До target пропускаются только строки и комментарии, которые могут через него переходить
+    while True:
+        match = SKIPPED_START_REGEX.search(data, position, target)
+        if match is None:
+            position = max(position, target)
+            break
+        position = SKIPPED_REGEX.match(data, match.start()).end()
+        if position >= target:
+            break
+    while True:
+        match = BOUNDARY_REGEX.search(data, position)
+        if match is None:
+            return len(data)
+        if match.group() == b';':
+            return match.end()
+        position = SKIPPED_REGEX.match(data, match.start()).end()
+
+# Разбирает часть файла в компактные буферы токенов. Выполняется в процессе-
+# исполнителе: часть читается из отображённого в память файла path, либо
+# передаётся готовыми байтами data. Строки и столбцы - относительно начала части.
+# Значения хранятся только у чисел, строк и идентификаторов.
+def lex_chunk(path, start, end, data=None):
+    if data is None:
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = mapped[start:end]
+    text = data.decode('utf-8')
+    kinds = array('i')
+    lines = array('i')
+    columns = array('i')
+    values = []
+    for kind, value, line, column in tokenize(text):
+        kinds.append(kind)
+        lines.append(line)
+        columns.append(column)
+        if kind in (TOKEN_NUMBER, TOKEN_STRING, TOKEN_IDENTIFIER):
+            values.append(value)
+    return kinds, lines, columns, values, text.count('\n')
+
+# Параллельный лексер для очень больших файлов. Файл отображается в память
+# (mmap) и делится на части по ';' вне строк и комментариев; части разбираются
+# функцией tokenize в пуле процессов, и их токены выдаются по порядку с
+# глобальными номерами строк и столбцов. Интерфейс совпадает с Lexer.
+class ParallelLexer:
+    def __init__(self, input_stream, jobs=None):
+        self.identifier_str = ''  # Строка для хранения идентификаторов
+        self.num_val = 0  # Числовое значение токена
+        self.string_val = ''  # Строковое значение токена
+        self.line = 1  # Строка текущего токена
+        self.column = 1  # Столбец текущего токена
+        self.chunks = self.lex(input_stream, jobs)
+        self.chunk_index = -1
+        self.next_chunk()
+
+    # Буферы токенов всех частей и сдвиги их строк и столбцов
+    def lex(self, input_stream, jobs):
+        mapped = None
+        try:
+            mapped = mmap.mmap(input_stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # Не файл (StringIO, канал) или пустой файл
+            data = input_stream.read().encode('utf-8')
+        else:
+            data = mapped
+        try:
+            bounds = [0]
+            while bounds[-1] < len(data):
+                bounds.append(find_boundary(data, bounds[-1], bounds[-1] + PARALLEL_CHUNK_SIZE))
+            if len(bounds) <= 2:
+                results = [lex_chunk(None, 0, 0, data[:])]
+            else:
+                with ProcessPoolExecutor(max_workers=jobs) as executor:
+                    if mapped is not None:
+                        futures = [executor.submit(lex_chunk, input_stream.name, start, end)
+                                   for start, end in zip(bounds, bounds[1:])]
+                    else:
+                        futures = [executor.submit(lex_chunk, None, 0, 0, data[start:end])
+                                   for start, end in zip(bounds, bounds[1:])]
+                    results = [future.result() for future in futures]
+            # Сдвиг строк части - число переводов строк до неё; сдвиг столбцов
+            # её первой строки - длина начала этой строки в предыдущей части
+            chunks = []
+            line_offset = 0
+            for start, (kinds, lines, columns, values, newlines) in zip(bounds, results):
+                line_start = data.rfind(b'\n', 0, start) + 1
+                column_offset = len(data[line_start:start].decode('utf-8'))
+                chunks.append((kinds, lines, columns, values, line_offset, column_offset))
+                line_offset += newlines
+            return chunks
+        finally:
+            if mapped is not None:
+                mapped.close()
+
+    def next_chunk(self):
+        self.chunk_index += 1
+        (self.kinds, self.lines, self.columns, self.values,
+         self.line_offset, self.column_offset) = self.chunks[self.chunk_index]
+        self.position = 0
+        self.value_position = 0
+
+    def get_token(self):
+        kind = self.kinds[self.position]
+        # Конец части, кроме последней, - переход к следующей
+        while kind == TOKEN_EOF and self.chunk_index + 1 < len(self.chunks):
+            self.next_chunk()
+            kind = self.kinds[self.position]
+        line = self.lines[self.position]
+        self.line = line + self.line_offset
+        self.column = self.columns[self.position] + (self.column_offset if line == 1 else 0)
+        if kind == TOKEN_EOF:
+            return kind
+        self.position += 1
+        if kind == TOKEN_NUMBER:
+            self.num_val = self.values[self.value_position]
+            self.value_position += 1
+        elif kind == TOKEN_STRING:
+            self.string_val = self.values[self.value_position]
+            self.value_position += 1
+        elif kind == TOKEN_IDENTIFIER:
+            self.identifier_str = self.values[self.value_position]
+            self.value_position += 1
+        return kind
@@ -1,83 +1,272 @@
 #!/usr/bin/env python3
+import argparse
+import io
+import marshal
+import math
+import operator
+import os
+import signal
 import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from lexer import *
+from vm import *
+from codegen import *
+from arrays import *
+from optimizer import *
+from cache import *
+from output import *
+from inputs import *
+from profiler import *
+from trampoline import *
+from memo import *
+from arena import slot_names
 
-# Базовый класс для всех выражений
+# Базовый класс для всех выражений.
+# Поля узлов хранятся в слотах (__slots__) без словаря __dict__ у каждого
+# узла: большие программы занимают заметно меньше памяти.
 class ExprAST:
-    def evaluate(self):
+    # Позиция начала выражения в исходном тексте (None у узлов, созданных
+    # оптимизатором) и глубина дерева выражения (у составных узлов задаётся в __init__)
+    __slots__ = ('line', 'column', 'depth')
+
+    def __new__(cls, *args):
+        node = super().__new__(cls)
+        node.line = None
+        node.column = None
+        node.depth = 1
+        return node
+
+    # Разрешение имён: каждой переменной назначается ячейка кадра.
+    # Составные узлы - генераторы для trampoline(): вызов для дочернего узла
+    # выдаётся через yield, а не выполняется рекурсивно.
+    def resolve(self, symbols):
+        raise NotImplementedError
+
+    # Вывод типа значения выражения (см. optimizer.py); записи в переменные
+    # сообщаются оптимизатору через opt.store
+    def infer(self, opt):
+        raise NotImplementedError
+
+    # Оптимизация: возвращает эквивалентный, возможно упрощённый, узел
+    def optimize(self, opt):
+        raise NotImplementedError
+
+    # Вычисление выражения; значения переменных хранятся в кадре frame
+    def evaluate(self, frame):
+        raise NotImplementedError
+
+    # Генерация байткода для VM: код выражения оставляет на стеке ровно одно значение.
+    # Как и resolve(), у составных узлов это генератор для trampoline().
+    def emit(self, code):
+        raise NotImplementedError
+
+    # Компиляция в замыкание без аргументов, которое вычисляет выражение над кадром frame
+    def compile(self, frame):
+        raise NotImplementedError
+
+    # Генерация кода Python: возвращает выражение Python, а нужные перед ним
+    # операторы добавляет в генератор
+    def to_python(self, gen):
+        raise NotImplementedError
+
+    # Генерация кода Python для выражения, значение которого не используется
+    def to_python_statement(self, gen):
+        gen.line(self.to_python(gen))
+
+    # Текст выражения для эха и сообщений об ошибках; у составных узлов генератор
+    def format(self):
         raise NotImplementedError
 
+    def __repr__(self) -> str:
+        return trampoline(self.format())
+
 # Класс для числовых выражений
 class NumberExprAST(ExprAST):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
-    def evaluate(self):
+    def resolve(self, symbols):
+        pass
+
+    def infer(self, opt):
+        return type(int_literal(self.value))
+
+    def optimize(self, opt):
+        if opt.int_literals:
+            self.value = int_literal(self.value)
+        return self
+
+    def evaluate(self, frame):
         return self.value
 
-    def __repr__(self) -> str:
+    def emit(self, code):
+        code.emit(OP_CONST, code.constant(self.value))
+
+    def compile(self, frame):
+        value = self.value
+        return lambda: value
+
+    def to_python(self, gen):
+        return repr(self.value)
+
+    def format(self) -> str:
         return str(self.value)
 
 # Класс для строковых выражений
 class StringExprAST(ExprAST):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
-    def evaluate(self):
-        print(self.value, end='')
+    def resolve(self, symbols):
+        pass
+
+    def infer(self, opt):
+        return str
+
+    def optimize(self, opt):
+        return self
+
+    def evaluate(self, frame):
+        output_sink.write(self.value)
         return ""
 
-    def __repr__(self) -> str:
+    def emit(self, code):
+        code.emit(OP_STRING, code.constant(self.value))
+
+    def compile(self, frame):
+        value = self.value
+        write = output_sink.write
+        def string():
+            write(value)
+            return ""
+        return string
+
+    def to_python(self, gen):
+        return f"x3_string({self.value!r})"
+
+    def format(self) -> str:
         return str(self.value)
 
 # Класс для выражений переменных
 class VariableExprAST(ExprAST):
+    __slots__ = ('name', 'slot')
+
     def __init__(self, name):
         self.name = name
+        self.slot = None
+
+    def resolve(self, symbols):
+        self.slot = symbols.lookup(self.name, 'int')
+
+    def infer(self, opt):
+        return opt.slot_type(self.slot)
+
+    def optimize(self, opt):
+        return self
 
-    def evaluate(self):
-        if self.name in named_values:
-            var = named_values[self.name]
-            if var['type'] == 'array':
-                raise RuntimeError(f"Array {self.name} used without index")
-            return var['value']
-        raise RuntimeError(f"Unknown variable name: {self.name}")
+    def evaluate(self, frame):
+        return frame[self.slot]
+
+    def emit(self, code):
+        code.emit(OP_LOAD, self.slot)
+
+    def compile(self, frame):
+        slot = self.slot
+        return lambda: frame[slot]
+
+    def to_python(self, gen):
+        return gen.variable(self.name)
     
-    def __repr__(self) -> str:
+    def format(self) -> str:
         return str(self.name)
 
 # Класс для бинарных выражений
 class BinaryExprAST(ExprAST):
+    __slots__ = ('operator', 'lhs', 'rhs', 'function')
+
     def __init__(self, operator, lhs, rhs):
         self.operator = operator
         self.lhs = lhs
         self.rhs = rhs
+        # Функция оператора выбирается один раз при создании узла;
+        # у && и || её нет, они вычисляются с сокращением
+        self.function = BINARY_FUNCTIONS.get(operator)
+        self.depth = max(lhs.depth, rhs.depth) + 1
 
-    def evaluate(self):
-        left_value = self.lhs.evaluate()
-        right_value = self.rhs.evaluate()
-        
-        if self.operator == ord('/'):
-            if right_value == 0:
-                raise ZeroDivisionError("Division by zero")
-            return left_value / right_value
-
-        result = {
-            ord('+'): left_value + right_value,
-            ord('-'): left_value - right_value,
-            ord('*'): left_value * right_value,
-            TOKEN_EQ: left_value == right_value,
-            TOKEN_NE: left_value != right_value,
-            TOKEN_LT: left_value < right_value,
-            TOKEN_LE: left_value <= right_value,
-            TOKEN_GT: left_value > right_value,
-            TOKEN_GE: left_value >= right_value,
-            TOKEN_AND: left_value and right_value,
-            TOKEN_OR: left_value or right_value,
-        }[self.operator]
-        return result
+    def resolve(self, symbols):
+        yield self.lhs.resolve(symbols)
+        yield self.rhs.resolve(symbols)
 
-    def __repr__(self) -> str:
+    def infer(self, opt):
+        return binary_type(self.operator, self.lhs.infer(opt), self.rhs.infer(opt))
+
+    def optimize(self, opt):
+        self.lhs = self.lhs.optimize(opt)
+        self.rhs = self.rhs.optimize(opt)
+        if isinstance(self.lhs, NumberExprAST) and isinstance(self.rhs, NumberExprAST):
+            value = opt.fold(self.operator, self.lhs.value, self.rhs.value)
+            if value is not None:
+                return NumberExprAST(value)
+        if opt.level >= 2:
+            return self.simplify(opt)
+        return self
+
+    # Алгебраические упрощения для числовых операндов. Операнд заменяет
+    # выражение, только если у результата тот же тип: x * 1 для целого x - это x,
+    # а x * 1.5 или x * 1 для логического x - уже нет.
+    def simplify(self, opt):
+        def is_constant(node, value):
+            return isinstance(node, NumberExprAST) and type(node.value) in (int, float) and node.value == value
+        def keeps_type(node, constant):
+            node_type = node.infer(opt)
+            return node_type is float or (node_type is int and type(constant.value) is int)
+        lhs, rhs = self.lhs, self.rhs
+        if self.operator == ord('*'):
+            if is_constant(rhs, 1) and keeps_type(lhs, rhs):
+                return lhs
+            if is_constant(lhs, 1) and keeps_type(rhs, lhs):
+                return rhs
+        if self.operator == ord('+'):
+            if is_constant(rhs, 0) and keeps_type(lhs, rhs):
+                return lhs
+            if is_constant(lhs, 0) and keeps_type(rhs, lhs):
+                return rhs
+        if self.operator == ord('-'):
+            if is_constant(rhs, 0) and keeps_type(lhs, rhs):
+                return lhs
+            if isinstance(lhs, VariableExprAST) and isinstance(rhs, VariableExprAST) and lhs.slot == rhs.slot:
+                value_type = lhs.infer(opt)
+                if value_type in (int, float):
+                    return NumberExprAST(value_type(0))
+        return self
+
+    def evaluate(self, frame):
+        return self.function(self.lhs.evaluate(frame), self.rhs.evaluate(frame))
+
+    def emit(self, code):
+        yield self.lhs.emit(code)
+        yield self.rhs.emit(code)
+        code.emit(BINARY_OPCODES[self.operator])
+
+    def compile(self, frame):
+        return BINARY_CLOSURES[self.operator](self.lhs.compile(frame), self.rhs.compile(frame))
+
+    def to_python(self, gen):
+        left = self.lhs.to_python(gen)
+        mark = gen.mark()
+        right = self.rhs.to_python(gen)
+        if gen.mark() > mark:
+            left = gen.hoist(mark, left)
+        return PYTHON_OPERATORS[self.operator].format(left, right)
+
+    def format(self):
         op = {
             TOKEN_EQ: "=",
             TOKEN_NE: "!=",
@@ -93,410 +282,2296 @@ class BinaryExprAST(ExprAST):
                 op = chr(self.operator)
             except:
                 op = str(self.operator)
-        return f"{self.lhs} {op} {self.rhs}"
+        lhs = yield self.lhs.format()
+        rhs = yield self.rhs.format()
+        return f"{lhs} {op} {rhs}"
+
+# Класс для &&: правый операнд вычисляется, только если левый истинен
+class AndExprAST(BinaryExprAST):
+    __slots__ = ()
+
+    def optimize(self, opt):
+        self.lhs = self.lhs.optimize(opt)
+        if isinstance(self.lhs, NumberExprAST):
+            return self.rhs.optimize(opt) if self.lhs.value else self.lhs
+        self.rhs = self.rhs.optimize(opt)
+        return self
+
+    def evaluate(self, frame):
+        return self.lhs.evaluate(frame) and self.rhs.evaluate(frame)
+
+    def emit(self, code):
+        yield self.lhs.emit(code)
+        jump = code.emit(OP_JUMP_IF_FALSE_OR_POP, 0)
+        yield self.rhs.emit(code)
+        code.patch(jump, code.position())
+
+    def to_python(self, gen):
+        return gen.short_circuit('and', self.lhs, self.rhs)
+
+# Класс для ||: правый операнд вычисляется, только если левый ложен
+class OrExprAST(BinaryExprAST):
+    __slots__ = ()
+
+    def optimize(self, opt):
+        self.lhs = self.lhs.optimize(opt)
+        if isinstance(self.lhs, NumberExprAST):
+            return self.lhs if self.lhs.value else self.rhs.optimize(opt)
+        self.rhs = self.rhs.optimize(opt)
+        return self
+
+    def evaluate(self, frame):
+        return self.lhs.evaluate(frame) or self.rhs.evaluate(frame)
+
+    def emit(self, code):
+        yield self.lhs.emit(code)
+        jump = code.emit(OP_JUMP_IF_TRUE_OR_POP, 0)
+        yield self.rhs.emit(code)
+        code.patch(jump, code.position())
+
+    def to_python(self, gen):
+        return gen.short_circuit('or', self.lhs, self.rhs)
+
+# Значение целого выражения, ограниченное по модулю числом limit (bounded_int):
+# оптимизатор уровня 2 оборачивает им значения, которые записываются в переменные
+# и передаются в функции или возвращаются из них, чтобы целые не росли без предела.
+# is_int - тип значения выведен как int, и проверка обходится без вызова функции.
+class BoundedIntExprAST(ExprAST):
+    __slots__ = ('expr', 'limit', 'is_int')
+
+    def __init__(self, expr, limit=EXACT_INT_LIMIT, is_int=False):
+        self.expr = expr
+        self.limit = limit
+        self.is_int = is_int
+        self.depth = expr.depth + 1
+
+    def resolve(self, symbols):
+        yield self.expr.resolve(symbols)
+
+    def infer(self, opt):
+        return self.expr.infer(opt)
+
+    def optimize(self, opt):
+        return self
+
+    def evaluate(self, frame):
+        value = self.expr.evaluate(frame)
+        if self.is_int and -self.limit <= value <= self.limit:
+            return value
+        return bounded_int(value, self.limit)
+
+    def emit(self, code):
+        yield self.expr.emit(code)
+        code.emit(OP_BOUND_INT, code.constant(self.limit))
+
+    def compile(self, frame):
+        expr = self.expr.compile(frame)
+        limit = self.limit
+        if not self.is_int:
+            return lambda: bounded_int(expr(), limit)
+        def bounded():
+            value = expr()
+            if -limit <= value <= limit:
+                return value
+            return bounded_int(value, limit)
+        return bounded
+
+    def to_python(self, gen):
+        value = self.expr.to_python(gen)
+        temp = gen.temp()
+        limit = self.limit
+        if self.is_int:
+            return f"({temp} if -{limit} <= ({temp} := {value}) <= {limit} else x3_bounded_int({temp}, {limit}))"
+        return f"({temp} if type({temp} := {value}) is not int or -{limit} <= {temp} <= {limit} " \
+               f"else x3_bounded_int({temp}, {limit}))"
+
+    def format(self):
+        return (yield self.expr.format())
+
+# Оборачивает значение expr узлом BoundedIntExprAST, если в нём может оказаться
+# целое больше limit по модулю. Значения вещественного, логического и строкового
+# типа целыми не бывают, а константы и переменные уже ограничены. Не ограничиваются
+# и значения, которые растут медленно: линейные (is_linear) и, при записи
+# в ячейку slot, накопление s = s + E, где E - арифметика над счётчиками.
+def bound_int(expr, opt, limit=EXACT_INT_LIMIT, slot=None):
+    if not opt.int_literals or is_linear(expr) or slot is not None and is_accumulation(expr, slot, opt):
+        return expr
+    value_type = expr.infer(opt)
+    if value_type in (float, bool, str):
+        return expr
+    return BoundedIntExprAST(expr, limit, value_type is int)
+
+# Константа, переменная или переменная плюс или минус константа (значение блока -
+# его последнее выражение). Такие значения растут не быстрее счётчика цикла,
+# поэтому i = i + 1 или f(n - 1) ограничивать не нужно. Если задана ячейка slot,
+# переменная должна быть именно она (приращение счётчика).
+def is_linear(expr, slot=None):
+    while type(expr) is BlockExprAST and expr.expressions:
+        expr = expr.expressions[-1]
+    if type(expr) is BinaryExprAST and expr.operator in (ord('+'), ord('-')):
+        if type(expr.rhs) is NumberExprAST:
+            expr = expr.lhs
+        elif type(expr.lhs) is NumberExprAST and expr.operator == ord('+'):
+            expr = expr.rhs
+        else:
+            return False
+        return type(expr) is VariableExprAST and (slot is None or expr.slot == slot)
+    return type(expr) is NumberExprAST or type(expr) is VariableExprAST and slot is None
+
+# s + E, E + s или s - E для переменной s в ячейке slot, где E - арифметика над
+# константами и счётчиками (opt.is_counter): за одну запись s меняется на
+# величину, которая растёт не быстрее многочлена от числа итераций
+def is_accumulation(expr, slot, opt):
+    if type(expr) is not BinaryExprAST or expr.operator not in (ord('+'), ord('-')):
+        return False
+    def is_self(node):
+        return type(node) is VariableExprAST and node.slot == slot
+    if is_self(expr.lhs):
+        other = expr.rhs
+    elif is_self(expr.rhs) and expr.operator == ord('+'):
+        other = expr.lhs
+    else:
+        return False
+    if not is_arithmetic(other):
+        return False
+    stack = [other]
+    while stack:
+        node = stack.pop()
+        if type(node) is VariableExprAST:
+            if node.slot == slot or not opt.is_counter(node.slot):
+                return False
+        elif type(node) is BinaryExprAST:
+            stack.append(node.lhs)
+            stack.append(node.rhs)
+    return True
 
 # Класс для if-выражений
 class IfExprAST(ExprAST):
+    __slots__ = ('condition', 'then_expr')
+
     def __init__(self, condition, then_expr):
         self.condition = condition
         self.then_expr = then_expr
+        self.depth = max(condition.depth, then_expr.depth) + 1
+
+    def resolve(self, symbols):
+        yield self.condition.resolve(symbols)
+        yield self.then_expr.resolve(symbols)
+
+    def infer(self, opt):
+        self.condition.infer(opt)
+        return join_types(self.then_expr.infer(opt), float)
+
+    def optimize(self, opt):
+        self.condition = self.condition.optimize(opt)
+        self.then_expr = self.then_expr.optimize(opt)
+        if isinstance(self.condition, NumberExprAST):
+            return self.then_expr if self.condition.value else NumberExprAST(0.0)
+        return self
 
-    def evaluate(self):
-        if self.condition.evaluate():
-            return self.then_expr.evaluate()
+    def evaluate(self, frame):
+        if self.condition.evaluate(frame):
+            return self.then_expr.evaluate(frame)
         return 0.0
+
+    def emit(self, code):
+        yield self.condition.emit(code)
+        else_jump = code.emit(OP_JUMP_IF_FALSE, 0)
+        yield self.then_expr.emit(code)
+        end_jump = code.emit(OP_JUMP, 0)
+        code.patch(else_jump, code.position())
+        code.emit(OP_CONST, code.constant(0.0))
+        code.patch(end_jump, code.position())
+
+    def compile(self, frame):
+        condition = self.condition.compile(frame)
+        then_expr = self.then_expr.compile(frame)
+        def if_expr():
+            if condition():
+                return then_expr()
+            return 0.0
+        return if_expr
+
+    def to_python(self, gen):
+        result = gen.temp()
+        gen.line(f"if {self.condition.to_python(gen)}:")
+        gen.body(lambda: gen.line(f"{result} = {self.then_expr.to_python(gen)}"))
+        gen.line("else:")
+        gen.line(f"    {result} = 0.0")
+        return result
+
+    def to_python_statement(self, gen):
+        gen.line(f"if {self.condition.to_python(gen)}:")
+        gen.body(lambda: self.then_expr.to_python_statement(gen))
     
-    def __repr__(self) -> str:
-        return f"{self.condition} {self.then_expr} if"
+    def format(self):
+        condition = yield self.condition.format()
+        then_expr = yield self.then_expr.format()
+        return f"{condition} {then_expr} if"
 
 # Класс для блоков выражений
 class BlockExprAST(ExprAST):
+    __slots__ = ('expressions',)
+
     def __init__(self, expressions):
-        self.expressions = expressions
+        self.expressions = tuple(expressions)
+        self.depth = max((expr.depth for expr in expressions), default=0) + 1
+
+    def resolve(self, symbols):
+        for expr in self.expressions:
+            yield expr.resolve(symbols)
 
-    def evaluate(self):
+    def infer(self, opt):
+        result = float
+        for expr in self.expressions:
+            result = expr.infer(opt)
+        return result
+
+    def optimize(self, opt):
+        expressions = []
+        for expr in self.expressions:
+            expr = expr.optimize(opt)
+            if isinstance(expr, BlockExprAST):
+                expressions.extend(expr.expressions)
+            else:
+                expressions.append(expr)
+        # Константы не в конце блока ничего не делают
+        *init, last = expressions or [NumberExprAST(0.0)]
+        expressions = [expr for expr in init if not isinstance(expr, NumberExprAST)] + [last]
+        if len(expressions) == 1:
+            return expressions[0]
+        self.expressions = tuple(expressions)
+        return self
+
+    def evaluate(self, frame):
         result = 0.0
         for expr in self.expressions:
-            result = expr.evaluate()
+            result = expr.evaluate(frame)
         return result
 
-    def __repr__(self) -> str:
-        return " ; ".join(str(expr) for expr in self.expressions)
+    def emit(self, code):
+        if not self.expressions:
+            code.emit(OP_CONST, code.constant(0.0))
+        for i, expr in enumerate(self.expressions):
+            if i > 0:
+                code.emit(OP_POP)
+            yield expr.emit(code)
+
+    def compile(self, frame):
+        if not self.expressions:
+            return lambda: 0.0
+        *init, last = [expr.compile(frame) for expr in self.expressions]
+        def block():
+            for expr in init:
+                expr()
+            return last()
+        return block
+
+    def to_python(self, gen):
+        if not self.expressions:
+            return "0.0"
+        for expr in self.expressions[:-1]:
+            expr.to_python_statement(gen)
+        return self.expressions[-1].to_python(gen)
+
+    def to_python_statement(self, gen):
+        for expr in self.expressions:
+            expr.to_python_statement(gen)
+
+    def format(self):
+        parts = []
+        for expr in self.expressions:
+            parts.append((yield expr.format()))
+        return " ; ".join(parts)
 
 # Класс для работы с массивами
 class ArrayExprAST(ExprAST):
+    __slots__ = ('name', 'index', 'slot', 'index_is_int')
+
     def __init__(self, name, index):
         self.name = name
         self.index = index
+        self.slot = None
+        self.index_is_int = type(index) is StridedIndexExprAST  # Индекс всегда целый (смещение или вывод типов уровня 2)
+        self.depth = index.depth + 1
+
+    def resolve(self, symbols):
+        self.slot = symbols.lookup(self.name, 'array')
+        yield self.index.resolve(symbols)
+
+    def infer(self, opt):
+        self.index.infer(opt)
+        return float
+
+    def optimize(self, opt):
+        self.index = self.index.optimize(opt)
+        if opt.level >= 2:
+            self.index_is_int = self.index.infer(opt) is int
+        return self
+
+    def evaluate(self, frame):
+        idx = int(self.index.evaluate(frame))
+        array = frame[self.slot]
+        if 0 <= idx < len(array):
+            return array[idx]
+        else:
+            raise IndexError("Array index out of bounds")
 
-    def evaluate(self):
-        if self.name in named_values:
-            if named_values[self.name]['type'] == 'array':
-                idx = int(self.index.evaluate())
-                array = named_values[self.name]['value']
-                if 0 <= idx < len(array):
-                    return array[idx]
-                else:
-                    raise IndexError("Array index out of bounds")
-        raise RuntimeError(f"Unknown array name: {self.name}")
+    def emit(self, code):
+        yield self.index.emit(code)
+        code.emit(OP_LOAD_ELEM, self.slot)
+
+    def compile(self, frame):
+        slot = self.slot
+        index = self.index.compile(frame)
+        convert = not self.index_is_int
+        def element():
+            idx = index()
+            if convert:
+                idx = int(idx)
+            array = frame[slot]
+            if 0 <= idx < len(array):
+                return array[idx]
+            raise IndexError("Array index out of bounds")
+        return element
+
+    def to_python(self, gen):
+        array = gen.variable(self.name)
+        index = self.index.to_python(gen)
+        if not self.index_is_int:
+            index = f"int({index})"
+        idx = gen.temp()
+        return f"({array}[{idx}] if 0 <= ({idx} := {index}) < len({array}) else x3_out_of_bounds())"
     
-    def __repr__(self) -> str:
-        return f"{self.name}[{self.index}]"
+    def format(self):
+        index = yield self.index.format()
+        return f"{self.name}[{index}]"
     
-# Класс для объявления массивов
+# Индекс элемента многомерного массива имя[i][j]...: смещение элемента в
+# непрерывном буфере массива (см. array_offset). Каждый индекс проверяется по
+# своему измерению, а родительский узел (ArrayExprAST, присваивание, встроенная
+# операция) обращается по смещению, как к элементу одномерного массива.
+# Форма массива берётся из таблицы имён при разрешении имён.
+class StridedIndexExprAST(ExprAST):
+    __slots__ = ('name', 'indexes', 'shape', 'indexes_are_int')
+
+    def __init__(self, name, indexes):
+        self.name = name
+        self.indexes = tuple(indexes)
+        self.shape = ()
+        self.indexes_are_int = False  # Все индексы всегда целые (вывод типов уровня 2)
+        self.depth = max(index.depth for index in self.indexes) + 1
+
+    def resolve(self, symbols):
+        for index in self.indexes:
+            yield index.resolve(symbols)
+        self.shape = symbols.shapes.get(self.name, ())
+        if len(self.shape) != len(self.indexes):
+            raise RuntimeError(f"Wrong number of indexes for array {self.name}")
+
+    def infer(self, opt):
+        for index in self.indexes:
+            index.infer(opt)
+        return int
+
+    def optimize(self, opt):
+        self.indexes = tuple(index.optimize(opt) for index in self.indexes)
+        if opt.level >= 2:
+            self.indexes_are_int = all(index.infer(opt) is int for index in self.indexes)
+        return self
+
+    def evaluate(self, frame):
+        if len(self.indexes) != 2:
+            return array_offset(self.shape, [index.evaluate(frame) for index in self.indexes])
+        row_index, column_index = self.indexes
+        rows, columns = self.shape
+        row = row_index.evaluate(frame)
+        column = column_index.evaluate(frame)
+        row = int(row)
+        if 0 <= row < rows:
+            column = int(column)
+            if 0 <= column < columns:
+                return row * columns + column
+        raise IndexError("Array index out of bounds")
+
+    def emit(self, code):
+        for index in self.indexes:
+            yield index.emit(code)
+        if len(self.shape) == 2:
+            code.emit(OP_OFFSET_2D, *self.shape)
+        else:
+            code.emit(OP_OFFSET, code.constant(self.shape))
+
+    def compile(self, frame):
+        shape = self.shape
+        indexes = [index.compile(frame) for index in self.indexes]
+        if len(shape) != 2:
+            def offset():
+                return array_offset(shape, [index() for index in indexes])
+            return offset
+        # Двумерный массив - самый частый случай: смещение считается без цикла
+        row_index, column_index = indexes
+        rows, columns = shape
+        if self.indexes_are_int:
+            def int_offset_2d():
+                row = row_index()
+                column = column_index()
+                if 0 <= row < rows and 0 <= column < columns:
+                    return row * columns + column
+                raise IndexError("Array index out of bounds")
+            return int_offset_2d
+        def offset_2d():
+            row = row_index()
+            column = column_index()
+            row = int(row)
+            if 0 <= row < rows:
+                column = int(column)
+                if 0 <= column < columns:
+                    return row * columns + column
+            raise IndexError("Array index out of bounds")
+        return offset_2d
+
+    def to_python(self, gen):
+        mark = gen.mark()
+        values = [index.to_python(gen) for index in self.indexes]
+        if gen.mark() == mark and all(is_arithmetic(index) for index in self.indexes[1:]):
+            # Индексы после первого не имеют побочных эффектов и не завершаются
+            # ошибкой, поэтому их можно вычислять после проверки предыдущих
+            temps = [gen.temp() for _ in values]
+            checks = []
+            for temp, value, size in zip(temps, values, self.shape):
+                value = value if self.indexes_are_int else f"int({value})"
+                checks.append(f"0 <= ({temp} := {value}) < {size}")
+            return f"({self.python_offset(temps)} if {' and '.join(checks)} else x3_out_of_bounds())"
+        del gen.lines[mark:]
+        temps = []
+        for index in self.indexes:
+            temp = gen.temp()
+            gen.line(f"{temp} = {index.to_python(gen)}")
+            temps.append(temp)
+        checks = []
+        for temp, size in zip(temps, self.shape):
+            value = temp if self.indexes_are_int else f"({temp} := int({temp}))"
+            checks.append(f"0 <= {value} < {size}")
+        gen.line(f"if not ({' and '.join(checks)}):")
+        gen.line("    x3_out_of_bounds()")
+        return self.python_offset(temps)
+
+    # Смещение по индексам в переменных temps
+    def python_offset(self, temps):
+        offset = temps[0]
+        for temp, size in zip(temps[1:], self.shape[1:]):
+            offset = f"({offset} * {size} + {temp})"
+        return offset
+
+    # Родительский узел заключает индекс в скобки: получается имя[i][j]
+    def format(self):
+        parts = []
+        for index in self.indexes:
+            parts.append((yield index.format()))
+        return "][".join(parts)
+
+# Класс для объявления массивов. shape - размеры измерений, size - число элементов
 class ArrayDeclarationExprAST(ExprAST):
-    def __init__(self, name, size):
+    __slots__ = ('name', 'size', 'shape', 'slot')
+
+    def __init__(self, name, shape):
         self.name = name
-        self.size = size
+        self.shape = tuple(shape)
+        self.size = math.prod(self.shape)
+        self.slot = None
+
+    def resolve(self, symbols):
+        self.slot = symbols.declare(self.name, 'array')
+        symbols.shapes[self.name] = self.shape
 
-    def evaluate(self):
-        named_values[self.name] = {'type': 'array', 'value': [0] * self.size}
+    def infer(self, opt):
+        return float
+
+    def optimize(self, opt):
+        return self
+
+    def evaluate(self, frame):
+        frame[self.slot] = new_array(self.size)
         return 0.0
+
+    def emit(self, code):
+        code.emit(OP_NEW_ARRAY, self.slot, self.size)
+
+    def compile(self, frame):
+        slot = self.slot
+        size = self.size
+        def declare_array():
+            frame[slot] = new_array(size)
+            return 0.0
+        return declare_array
+
+    def to_python(self, gen):
+        self.to_python_statement(gen)
+        return "0.0"
+
+    def to_python_statement(self, gen):
+        gen.line(f"{gen.variable(self.name)} = x3_new_array({self.size})")
     
-    def __repr__(self) -> str:
-        return f"{self.name}[{self.size}] array"
+    def format(self) -> str:
+        return f"{self.name}{''.join(f'[{size}]' for size in self.shape)} array"
 
 # Класс для присваивания переменных
 class VariableAssignmentExprAST(ExprAST):
+    __slots__ = ('name', 'expr', 'index', 'slot', 'index_is_int')
+
     def __init__(self, name, expr, index=None):
         self.name = name
         self.expr = expr
         self.index = index
+        self.slot = None
+        self.index_is_int = type(index) is StridedIndexExprAST  # Индекс всегда целый (смещение или вывод типов уровня 2)
+        self.depth = max(expr.depth, index.depth if index else 0) + 1
 
-    def evaluate(self):
-        value = self.expr.evaluate()
+    def resolve(self, symbols):
+        yield self.expr.resolve(symbols)
+        if self.index:
+            self.slot = symbols.lookup(self.name, 'array')
+            yield self.index.resolve(symbols)
+        else:
+            self.slot = symbols.lookup(self.name, 'int')
+
+    def infer(self, opt):
+        value_type = self.expr.infer(opt)
+        if self.index:
+            self.index.infer(opt)
+        else:
+            opt.store(self.slot, value_type, is_linear(self.expr, self.slot))
+        return value_type
+
+    def optimize(self, opt):
+        self.expr = self.expr.optimize(opt)
+        if self.index:
+            self.index = self.index.optimize(opt)
+            if opt.level >= 2:
+                self.index_is_int = self.index.infer(opt) is int
+        else:
+            self.expr = bound_int(self.expr, opt, slot=self.slot)
+        return self
+
+    def evaluate(self, frame):
+        value = self.expr.evaluate(frame)
         if self.index:  # Это массив
-            if self.name in named_values and named_values[self.name]['type'] == 'array':
-                idx = int(self.index.evaluate())
-                array = named_values[self.name]['value']
-                if 0 <= idx < len(array):
-                    array[idx] = value
-                else:
-                    raise IndexError("Array index out of bounds")
+            idx = int(self.index.evaluate(frame))
+            array = frame[self.slot]
+            if 0 <= idx < len(array):
+                array[idx] = value
             else:
-                raise RuntimeError(f"Unknown array name: {self.name}")
+                raise IndexError("Array index out of bounds")
         else:  # Это обычная переменная
-            if self.name in named_values:
-                named_values[self.name]['value'] = value
-            else:
-                raise RuntimeError(f"Unknown variable name: {self.name}")
+            frame[self.slot] = value
         return value
+
+    def emit(self, code):
+        yield self.expr.emit(code)
+        if self.index:
+            yield self.index.emit(code)
+            code.emit(OP_STORE_ELEM, self.slot)
+        else:
+            code.emit(OP_STORE, self.slot)
+
+    def compile(self, frame):
+        value = self.expr.compile(frame)
+        slot = self.slot
+        if not self.index:
+            def assign():
+                result = value()
+                frame[slot] = result
+                return result
+            return assign
+        index = self.index.compile(frame)
+        convert = not self.index_is_int
+        def assign_element():
+            result = value()
+            idx = index()
+            if convert:
+                idx = int(idx)
+            array = frame[slot]
+            if 0 <= idx < len(array):
+                array[idx] = result
+            else:
+                raise IndexError("Array index out of bounds")
+            return result
+        return assign_element
+
+    def to_python(self, gen):
+        value = self.expr.to_python(gen)
+        variable = gen.variable(self.name)
+        if not self.index:
+            return f"({variable} := {value})"
+        result = gen.temp()
+        gen.line(f"{result} = {value}")
+        idx = gen.temp()
+        index = self.index.to_python(gen)
+        gen.line(f"{idx} = {index}" if self.index_is_int else f"{idx} = int({index})")
+        gen.line(f"if 0 <= {idx} < len({variable}):")
+        gen.line(f"    {variable}[{idx}] = {result}")
+        gen.line("else:")
+        gen.line("    x3_out_of_bounds()")
+        return result
+
+    def to_python_statement(self, gen):
+        if self.index:
+            self.to_python(gen)
+        else:
+            gen.line(f"{gen.variable(self.name)} = {self.expr.to_python(gen)}")
     
-    def __repr__(self):
+    def format(self):
+        expr = yield self.expr.format()
         if self.index:
-            return f"{self.name}[{self.index}] = {self.expr}"
-        return f"{self.name} = {self.expr}"
+            index = yield self.index.format()
+            return f"{self.name}[{index}] = {expr}"
+        return f"{self.name} = {expr}"
 
 # Класс для объявления переменных
 class VariableDeclarationExprAST(ExprAST):
+    __slots__ = ('name', 'expr', 'slot')
+
     def __init__(self, name, expr):
         self.name = name
         self.expr = expr
+        self.slot = None
+        self.depth = expr.depth + 1
+
+    def resolve(self, symbols):
+        yield self.expr.resolve(symbols)
+        self.slot = symbols.declare(self.name, 'int')
+
+    def infer(self, opt):
+        value_type = self.expr.infer(opt)
+        opt.store(self.slot, value_type, type(self.expr) is NumberExprAST)
+        return value_type
+
+    def optimize(self, opt):
+        self.expr = bound_int(self.expr.optimize(opt), opt)
+        return self
 
-    def evaluate(self):
-        value = self.expr.evaluate()
-        named_values[self.name] = {'type': 'int', 'value': value}
+    def evaluate(self, frame):
+        value = self.expr.evaluate(frame)
+        frame[self.slot] = value
         return value
 
-    def __repr__(self) -> str:
-        return f"{self.name} = {self.expr}"
+    def emit(self, code):
+        yield self.expr.emit(code)
+        code.emit(OP_STORE, self.slot)
+
+    def compile(self, frame):
+        value = self.expr.compile(frame)
+        slot = self.slot
+        def declare():
+            result = value()
+            frame[slot] = result
+            return result
+        return declare
+
+    def to_python(self, gen):
+        return f"({gen.variable(self.name)} := {self.expr.to_python(gen)})"
+
+    def to_python_statement(self, gen):
+        value = self.expr.to_python(gen)
+        gen.line(f"{gen.variable(self.name)} = {value}")
+
+    def format(self):
+        expr = yield self.expr.format()
+        return f"{self.name} = {expr}"
 
 # Класс для while-выражений
 class WhileExprAST(ExprAST):
+    __slots__ = ('condition', 'body')
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
+        self.depth = max(condition.depth, body.depth) + 1
 
-    def evaluate(self):
+    def resolve(self, symbols):
+        yield self.condition.resolve(symbols)
+        yield self.body.resolve(symbols)
+
+    def infer(self, opt):
+        self.condition.infer(opt)
+        return join_types(self.body.infer(opt), float)
+
+    def optimize(self, opt):
+        self.condition = self.condition.optimize(opt)
+        self.body = self.body.optimize(opt)
+        if isinstance(self.condition, NumberExprAST) and not self.condition.value:
+            return NumberExprAST(0.0)
+        return counted_loop(self) or self
+
+    def evaluate(self, frame):
         result = 0.0
-        while self.condition.evaluate():
-            result = self.body.evaluate()
+        while self.condition.evaluate(frame):
+            result = self.body.evaluate(frame)
         return result
+
+    def emit(self, code):
+        code.emit(OP_CONST, code.constant(0.0))
+        loop_start = code.position()
+        yield self.condition.emit(code)
+        exit_jump = code.emit(OP_JUMP_IF_FALSE, 0)
+        code.emit(OP_POP)
+        yield self.body.emit(code)
+        code.emit(OP_LOOP if code.sliced else OP_JUMP, loop_start)
+        code.patch(exit_jump, code.position())
+
+    def compile(self, frame):
+        condition = self.condition.compile(frame)
+        body = self.body.compile(frame)
+        def while_expr():
+            result = 0.0
+            while condition():
+                result = body()
+            return result
+        return while_expr
+
+    def to_python(self, gen):
+        result = gen.temp()
+        gen.line(f"{result} = 0.0")
+        self.emit_python_loop(gen, result)
+        return result
+
+    def to_python_statement(self, gen):
+        self.emit_python_loop(gen, None)
+
+    # Цикл while; если условие порождает операторы, они вычисляются в начале
+    # каждой итерации. Значение тела сохраняется в result, если он задан.
+    def emit_python_loop(self, gen, result):
+        loop_line = gen.mark()
+        gen.line("while True:")
+        def body():
+            mark = gen.mark()
+            condition = self.condition.to_python(gen)
+            if gen.mark() == mark:
+                gen.lines[loop_line] = '    ' * (gen.indent - 1) + f"while {condition}:"
+            else:
+                gen.line(f"if not {condition}:")
+                gen.line("    break")
+            if result:
+                gen.line(f"{result} = {self.body.to_python(gen)}")
+            else:
+                self.body.to_python_statement(gen)
+        gen.body(body)
     
-    def __repr__(self):
-        return f"{self.condition} {self.body} while"
+    def format(self):
+        condition = yield self.condition.format()
+        body = yield self.body.format()
+        return f"{condition} {body} while"
+
+# Цикл со счётчиком: while (i op bound) { ...; i = i + step }, где остальное тело
+# не записывает ни i, ни переменные границы, а граница - выражение без побочных
+# эффектов. Граница вычисляется один раз до цикла, итерации перебирает range
+# (loop_trips), так что условие и приращение не вычисляются узлами на каждой
+# итерации; значения i получаются тем же сложением, что и в исходном цикле.
+# Поля condition и body исходного цикла сохраняются для VM и эха AST.
+class CountedWhileExprAST(WhileExprAST):
+    __slots__ = ('slot', 'name', 'operator', 'bound', 'step', 'loop_body')
+
+    def __init__(self, loop, step, loop_body):
+        super().__init__(loop.condition, loop.body)
+        self.line = loop.line
+        self.column = loop.column
+        self.slot = loop.condition.lhs.slot
+        self.name = loop.condition.lhs.name
+        self.operator = loop.condition.operator
+        self.bound = loop.condition.rhs
+        self.step = step
+        self.loop_body = loop_body  # Тело без приращения
+
+    def optimize(self, opt):
+        return self
+
+    def evaluate(self, frame):
+        slot = self.slot
+        step = self.step
+        body = self.loop_body
+        result = 0.0
+        for _ in loop_trips(frame[slot], self.bound.evaluate(frame), self.operator, step):
+            body.evaluate(frame)
+            result = frame[slot] = frame[slot] + step
+        return result
+
+    def compile(self, frame):
+        slot = self.slot
+        operator = self.operator
+        step = self.step
+        bound = self.bound.compile(frame)
+        body = self.loop_body.compile(frame)
+        def counted_while():
+            result = 0.0
+            for _ in loop_trips(frame[slot], bound(), operator, step):
+                body()
+                result = frame[slot] = frame[slot] + step
+            return result
+        return counted_while
+
+    def emit_python_loop(self, gen, result):
+        counter = gen.variable(self.name)
+        gen.line(f"for {gen.temp()} in x3_loop_trips({counter}, {self.bound.to_python(gen)}, "
+                 f"{self.operator}, {self.step!r}):")
+        def body():
+            self.loop_body.to_python_statement(gen)
+            if result:
+                gen.line(f"{result} = {counter} = {counter} + {self.step!r}")
+            else:
+                gen.line(f"{counter} = {counter} + {self.step!r}")
+        gen.body(body)
+
+# Цикл со счётчиком (CountedWhileExprAST) для оптимизированного цикла while или None
+def counted_loop(loop):
+    condition = loop.condition
+    if type(condition) is not BinaryExprAST or condition.operator not in COUNTED_OPERATORS:
+        return None
+    if type(condition.lhs) is not VariableExprAST:
+        return None
+    slot = condition.lhs.slot
+    body = loop.body.expressions if type(loop.body) is BlockExprAST else (loop.body,)
+    if len(body) < 2:
+        return None
+    *init, increment = body
+    step = counter_step(increment, slot)
+    if step is None or (step > 0) != (COUNTED_OPERATORS[condition.operator] > 0):
+        return None
+    written = written_slots(init)
+    if slot in written or not is_invariant(condition.rhs, written | {slot}):
+        return None
+    loop_body = init[0] if len(init) == 1 else set_position(BlockExprAST(init), init[0].line, init[0].column)
+    return CountedWhileExprAST(loop, step, loop_body)
+
+# Шаг приращения i = i + c, i = c + i или i = i - c переменной в ячейке slot;
+# None, если выражение не такое или шаг не целый
+def counter_step(expr, slot):
+    if type(expr) is not VariableAssignmentExprAST or expr.index is not None or expr.slot != slot:
+        return None
+    value = expr.expr
+    if type(value) is not BinaryExprAST:
+        return None
+    lhs, rhs = value.lhs, value.rhs
+    def is_counter(node):
+        return type(node) is VariableExprAST and node.slot == slot
+    if value.operator == ord('+') and is_counter(lhs) and type(rhs) is NumberExprAST:
+        step = rhs.value
+    elif value.operator == ord('+') and is_counter(rhs) and type(lhs) is NumberExprAST:
+        step = lhs.value
+    elif value.operator == ord('-') and is_counter(lhs) and type(rhs) is NumberExprAST:
+        step = -rhs.value
+    else:
+        return None
+    if type(step) not in (int, float) or step == 0 or not float(step).is_integer() or abs(step) > EXACT_INT_LIMIT:
+        return None
+    return step
+
+# Дочерние узлы по слотам узла
+def child_nodes(node):
+    for name in slot_names(type(node)):
+        value = getattr(node, name, None)
+        if isinstance(value, ExprAST):
+            yield value
+        elif isinstance(value, tuple):
+            yield from value
+
+# Ячейки переменных, в которые записывают выражения (присваивания и read)
+def written_slots(expressions):
+    slots = set()
+    stack = list(expressions)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (VariableAssignmentExprAST, VariableDeclarationExprAST)) and getattr(node, 'index', None) is None:
+            slots.add(node.slot)
+        elif isinstance(node, InputExprAST) and not node.is_array:
+            slots.add(node.slot)
+        stack.extend(child_nodes(node))
+    return slots
+
+# Выражение из чисел, переменных и операторов +, -, *: без побочных эффектов и ошибок
+def is_arithmetic(expr):
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if type(node) is BinaryExprAST and node.operator in ARITHMETIC_OPERATORS:
+            stack.append(node.lhs)
+            stack.append(node.rhs)
+        elif type(node) is not VariableExprAST and type(node) is not NumberExprAST:
+            return False
+    return True
+
+# Выражение без побочных эффектов, не читающее переменные из ячеек written
+def is_invariant(expr, written):
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, BinaryExprAST):
+            stack.append(node.lhs)
+            stack.append(node.rhs)
+        elif type(node) is VariableExprAST:
+            if node.slot in written:
+                return False
+        elif type(node) is not NumberExprAST:
+            return False
+    return True
 
 # Класс для print-выражений
 class PrintExprAST(ExprAST):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
+        self.depth = expr.depth + 1
+
+    def resolve(self, symbols):
+        yield self.expr.resolve(symbols)
 
-    def evaluate(self):
-        result = self.expr.evaluate()
-        print(result, end='')
+    def infer(self, opt):
+        return self.expr.infer(opt)
+
+    def optimize(self, opt):
+        self.expr = self.expr.optimize(opt)
+        return self
+
+    def evaluate(self, frame):
+        result = self.expr.evaluate(frame)
+        output_sink.write(format_value(result))
         return result
+
+    def emit(self, code):
+        yield self.expr.emit(code)
+        code.emit(OP_PRINT)
+
+    def compile(self, frame):
+        expr = self.expr.compile(frame)
+        write = output_sink.write
+        def print_expr():
+            result = expr()
+            write(format_value(result))
+            return result
+        return print_expr
+
+    def to_python(self, gen):
+        return f"x3_print({self.expr.to_python(gen)})"
     
-    def __repr__(self) -> str:
-        return f"{self.expr} print"
+    def format(self):
+        expr = yield self.expr.format()
+        return f"{expr} print"
 
 # Класс для endl-выражений
 class EndlExprAST(ExprAST):
-    def evaluate(self):
-        print()
+    __slots__ = ()
+
+    def resolve(self, symbols):
+        pass
+
+    def infer(self, opt):
+        return float
+
+    def optimize(self, opt):
+        return self
+
+    def evaluate(self, frame):
+        output_sink.line()
         return 0.0
+
+    def emit(self, code):
+        code.emit(OP_ENDL)
+
+    def compile(self, frame):
+        line = output_sink.line
+        def endl():
+            line()
+            return 0.0
+        return endl
+
+    def to_python(self, gen):
+        return "x3_endl()"
     
-    def __repr__(self) -> str:
+    def format(self) -> str:
         return "endl"
 
-# Класс для input-выражений
+# Класс для input-выражений.
+# read x читает одно число в переменную, read arr - заполняет весь массив.
 class InputExprAST(ExprAST):
+    __slots__ = ('name', 'slot', 'is_array')
+
     def __init__(self, name):
         self.name = name
+        self.slot = None
+        self.is_array = False
+
+    def resolve(self, symbols):
+        self.is_array = symbols.kinds.get(self.name) == 'array'
+        self.slot = symbols.lookup(self.name, 'array' if self.is_array else 'int')
+
+    def infer(self, opt):
+        if self.is_array:
+            return float
+        opt.store(self.slot, float)
+        return float
+
+    def optimize(self, opt):
+        return self
+
+    def evaluate(self, frame):
+        if self.is_array:
+            input_reader.read_into(frame[self.slot])
+            return 0.0
+        value = input_reader.read_number()
+        frame[self.slot] = value
+        return value
+
+    def emit(self, code):
+        code.emit(OP_INPUT_ARRAY if self.is_array else OP_INPUT, self.slot)
 
-    def evaluate(self):
-        if self.name in named_values:
-            value = float(input())
-            named_values[self.name]['value'] = value
+    def compile(self, frame):
+        slot = self.slot
+        if self.is_array:
+            read_into = input_reader.read_into
+            def read_array():
+                read_into(frame[slot])
+                return 0.0
+            return read_array
+        read_number = input_reader.read_number
+        def read():
+            value = read_number()
+            frame[slot] = value
             return value
-        raise RuntimeError(f"Unknown variable name: {self.name}")
+        return read
 
-    def __repr__(self) -> str:
+    def to_python(self, gen):
+        if self.is_array:
+            return f"x3_read_array({gen.variable(self.name)})"
+        return f"({gen.variable(self.name)} := x3_read())"
+
+    def format(self) -> str:
         return f"{self.name} input"
 
-# Глобальные переменные
-named_values = {}
+# Класс для вызова встроенной операции над массивами (arrays.py): sort(a), sum(a[2], n), copy(b, a).
+# Аргумент-массив хранится узлом ArrayExprAST, индекс которого - начало части
+# массива; сам элемент при этом не читается.
+class BuiltinCallExprAST(ExprAST):
+    __slots__ = ('name', 'args', 'function', 'params')
 
-# Лексер
-lexer = None
-current_token = None
+    def __init__(self, name, args):
+        self.name = name
+        self.args = tuple(args)
+        self.function, params = ARRAY_BUILTINS[name]
+        self.params = params + 'v' * (len(self.args) - len(params))  # Вид каждого аргумента
+        self.depth = max(arg.depth for arg in self.args) + 1
 
-def get_next_token():
-    global current_token
-    current_token = lexer.get_token()
-    try:
-        token_char = chr(current_token)
-    except:
-        token_char = current_token
-    return current_token
-
-def parse_expression():
-    lhs = parse_primary()
-    if not lhs:
-        raise RuntimeError("Error in parse_expression")
-    return parse_bin_op_rhs(0, lhs)
-
-def parse_number_expr():
-    result = NumberExprAST(lexer.num_val)
-    get_next_token()
-    return result
-
-def parse_string_expr():
-    result = StringExprAST(lexer.string_val)
-    get_next_token()
-    return result
-
-def parse_paren_expr():
-    get_next_token()
-    expression = parse_expression()
-    if not expression:
-        raise RuntimeError("Error in parse_expression")
-    if current_token != ord(')'):
-        raise RuntimeError("Expected ')'")
-    get_next_token()
-    return expression
-
-def parse_identifier_expr():
-    identifier_name = lexer.identifier_str
-    get_next_token()
-    if current_token == ord('['):
-        get_next_token()
-        index = parse_expression()
-        if current_token != ord(']'):
-            raise RuntimeError("Expected ']' after array index")
-        get_next_token()
-        if current_token == ord('='):
-            get_next_token()
-            expr = parse_expression()
-            return VariableAssignmentExprAST(identifier_name, expr, index)
-        return ArrayExprAST(identifier_name, index)
-    if current_token == ord('='):
-        get_next_token()
-        expr = parse_expression()
-        return VariableAssignmentExprAST(identifier_name, expr)
-    return VariableExprAST(identifier_name)
-
-def parse_while_expr():
-    get_next_token()
-    if current_token != ord('('):
-        raise RuntimeError("Expected '('")
-    get_next_token()
-    condition = parse_expression()
-    if not condition:
-        raise RuntimeError("Expected condition")
-    if current_token != ord(')'):
-        raise RuntimeError("Expected ')'")
-    get_next_token()
-    if current_token != ord('{'):
-        raise RuntimeError("Expected '{'")
-    body = parse_block()
-    if not body:
-        raise RuntimeError("Expected body")
-    return WhileExprAST(condition, body)
-
-def parse_print_expr():
-    get_next_token()
-    expr = parse_expression()
-    if not expr:
-        raise RuntimeError("Expected expression")
-    return PrintExprAST(expr)
-
-def parse_endl_expr():
-    get_next_token()
-    return EndlExprAST()
-
-def parse_input_expr():
-    get_next_token()
-    if current_token != TOKEN_IDENTIFIER:
-        raise RuntimeError("Expected identifier")
-    identifier_name = lexer.identifier_str
-    get_next_token()
-    return InputExprAST(identifier_name)
-
-def parse_primary():
-    if current_token == TOKEN_IDENTIFIER:
-        return parse_identifier_expr()
-    if current_token == TOKEN_NUMBER:
-        return parse_number_expr()
-    if current_token == TOKEN_STRING:
-        return parse_string_expr()
-    if current_token == ord('('):
-        return parse_paren_expr()
-    if current_token == TOKEN_IF:
-        return parse_if_expr()
-    if current_token == TOKEN_WHILE:
-        return parse_while_expr()
-    if current_token == TOKEN_PRINT:
-        return parse_print_expr()
-    if current_token == TOKEN_ENDL:
-        return parse_endl_expr()
-    if current_token == TOKEN_INPUT:
-        return parse_input_expr()
-    return None
-
-def get_token_precedence():
-    return {
-        ord('+'): 10,
-        ord('-'): 10,
-        ord('*'): 20,
-        ord('/'): 20,
-        TOKEN_EQ: 5,
-        TOKEN_NE: 5,
-        TOKEN_LT: 15,
-        TOKEN_LE: 15,
-        TOKEN_GT: 15,
-        TOKEN_GE: 15,
-        TOKEN_AND: 3,
-        TOKEN_OR: 1
-    }.get(current_token, -1)
-
-def parse_bin_op_rhs(expr_prec, lhs):
-    while True:
-        token_prec = get_token_precedence()
-        if token_prec < expr_prec:
+    def resolve(self, symbols):
+        for arg in self.args:
+            yield arg.resolve(symbols)
+
+    def infer(self, opt):
+        for arg in self.args:
+            arg.infer(opt)
+        return float
+
+    def optimize(self, opt):
+        self.args = tuple(arg.optimize(opt) for arg in self.args)
+        return self
+
+    def evaluate(self, frame):
+        values = []
+        for arg, param in zip(self.args, self.params):
+            if param == 'a':
+                values.append(frame[arg.slot])
+                values.append(arg.index.evaluate(frame))
+            else:
+                values.append(arg.evaluate(frame))
+        return self.function(*values)
+
+    def emit(self, code):
+        count = 0
+        for arg, param in zip(self.args, self.params):
+            if param == 'a':
+                code.emit(OP_LOAD, arg.slot)
+                yield arg.index.emit(code)
+                count += 2
+            else:
+                yield arg.emit(code)
+                count += 1
+        code.emit(OP_CALL, code.constant(self.function), count)
+
+    def compile(self, frame):
+        parts = []
+        for arg, param in zip(self.args, self.params):
+            if param == 'a':
+                parts.append(lambda slot=arg.slot: frame[slot])
+                parts.append(arg.index.compile(frame))
+            else:
+                parts.append(arg.compile(frame))
+        function = self.function
+        def call():
+            return function(*[part() for part in parts])
+        return call
+
+    def to_python(self, gen):
+        parts = []
+        for arg, param in zip(self.args, self.params):
+            if param == 'a':
+                parts.append(gen.variable(arg.name))
+                parts.append(arg.index.to_python(gen))
+            else:
+                parts.append(arg.to_python(gen))
+        return f"x3_{self.name}({', '.join(parts)})"
+
+    def format(self):
+        parts = []
+        for arg in self.args:
+            parts.append((yield arg.format()))
+        return f"{self.name}({', '.join(parts)})"
+
+# Суммарная глубина тел функций, которые сейчас вычисляют рекурсивно движки
+# tree и closure. У каждого потока своя: программы, исполняемые в разных
+# потоках, не сдвигают друг другу момент перехода в VM.
+class CallNesting(threading.local):
+    depth = 0
+
+# Функция X3: int имя(параметры) { тело }. Тело видит только параметры и
+# собственные переменные: у функции своя таблица имён, параметры занимают
+# первые ячейки кадра, за ними локальные переменные. Каждый вызов получает
+# новый кадр - список по ячейке на имя, поэтому рекурсивные вызовы не мешают
+# друг другу. У функций pure результаты запоминаются в кеше cache (memo.py).
+class Function:
+    # Глубина вложенных вызовов (CallNesting). Вызов, с которым она превысила бы
+    # RECURSION_DEPTH_LIMIT, исполняет VM: её стек вызовов не ограничен пределом
+    # рекурсии Python.
+    nesting = CallNesting()
+
+    def __init__(self, name, params, cache_size=None):
+        self.name = name
+        self.params = tuple(params)
+        self.symbols = SymbolTable()
+        self.body = None
+        self.padding = ()  # Начальные значения локальных переменных в кадре вызова
+        self.cache = None if cache_size is None else MemoCache(cache_size)
+        self.invokers = {}  # Движок -> вызов функции с кортежем аргументов
+        self.codes = {}  # sliced -> байткод тела для VM
+        self.bounds_ints = False
+
+    # Подготовленные движками вызовы и содержимое кеша в кеш программ не попадают
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['invokers'] = {}
+        state['codes'] = {}
+        if self.cache is not None:
+            state['cache'] = MemoCache(self.cache.size)
+        return state
+
+    def resolve(self):
+        for param in self.params:
+            self.symbols.declare(param, 'int')
+        yield self.body.resolve(self.symbols)
+        self.padding = (None,) * (len(self.symbols.slots) - len(self.params))
+
+    # Тело оптимизируется отдельно от программы: у него свои ячейки, а типы
+    # параметров неизвестны. На уровне 2 результат ограничивается (bound_int);
+    # bounds_ints - тело само ограничивает целые, которые в нём вычисляются
+    def optimize(self, level):
+        opt = Optimizer(level)
+        for slot in range(len(self.params)):
+            opt.store(slot, None)
+        # Известно до оптимизации тела: рекурсивные вызовы в нём на это смотрят
+        self.bounds_ints = level >= 2 and self.body.depth <= RECURSION_DEPTH_LIMIT
+        self.body = bound_int(opt.optimize_program([self.body])[0], opt)
+
+    # Вызов движком engine ('tree' или 'closure'): функция от кортежа аргументов.
+    # Тело глубже RECURSION_DEPTH_LIMIT и слишком глубоко вложенные вызовы исполняет VM.
+    def invoker(self, engine):
+        call = self.invokers.get(engine)
+        if call is not None:
+            return call
+        body = self.body
+        padding = self.padding
+        depth = body.depth + 1
+        shallow = depth <= RECURSION_DEPTH_LIMIT
+        call_vm = self.call_vm
+        nesting = Function.nesting
+        if not shallow:
+            call = call_vm
+        elif engine == 'tree':
+            def call(args):
+                if nesting.depth + depth > RECURSION_DEPTH_LIMIT:
+                    return call_vm(args)
+                nesting.depth += depth
+                try:
+                    return body.evaluate([*args, *padding])
+                finally:
+                    nesting.depth -= depth
+        else:
+            # Замыкания тела скомпилированы над одним кадром, поэтому на время
+            # вызова значения внешнего (рекурсивного) вызова из него сохраняются
+            frame = [None] * (len(self.params) + len(padding))
+            def call(args):
+                if nesting.depth + depth > RECURSION_DEPTH_LIMIT:
+                    return call_vm(args)
+                saved = frame[:]
+                frame[:] = (*args, *padding)
+                nesting.depth += depth
+                try:
+                    return run()
+                finally:
+                    nesting.depth -= depth
+                    frame[:] = saved
+        if self.cache is not None:
+            call = memoized(call, self.cache)
+        # Вызов запоминается до компиляции тела: рекурсивные вызовы в теле его уже находят
+        self.invokers[engine] = call
+        if engine == 'closure' and shallow:
+            run = body.compile(frame)
+        return call
+
+    # Вызов в VM с кортежем аргументов: её стек вызовов не ограничен пределом
+    # рекурсии Python. Сюда передают слишком глубокие вызовы все движки.
+    def call_vm(self, args):
+        return VM([*args, *self.padding]).run(self.code())
+
+    # Байткод тела; вызов и возврат выполняет сама VM (OP_INVOKE, OP_RETURN)
+    def code(self, sliced=False):
+        code = self.codes.get(sliced)
+        if code is None:
+            code = self.codes[sliced] = compile_code(self.body, sliced)
+        return code
+
+# Класс для объявления функций. Само объявление ничего не вычисляет;
+# функцию вызывают узлы CallExprAST.
+class FunctionDeclarationExprAST(ExprAST):
+    __slots__ = ('function',)
+
+    def __init__(self, function):
+        self.function = function
+        self.depth = function.body.depth + 1
+
+    def resolve(self, symbols):
+        yield self.function.resolve()
+
+    def infer(self, opt):
+        return float
+
+    def optimize(self, opt):
+        self.function.optimize(opt.level)
+        return self
+
+    def evaluate(self, frame):
+        return 0.0
+
+    def emit(self, code):
+        code.emit(OP_CONST, code.constant(0.0))
+
+    def compile(self, frame):
+        return lambda: 0.0
+
+    def to_python(self, gen):
+        self.to_python_statement(gen)
+        return "0.0"
+
+    def to_python_statement(self, gen):
+        gen.function(self.function)
+
+    def format(self):
+        function = self.function
+        body = yield function.body.format()
+        kind = "function" if function.cache is None else "pure function"
+        return f"{function.name}({', '.join(function.params)}) {body} {kind}"
+
+# Класс для вызова функции, объявленной в программе
+class CallExprAST(ExprAST):
+    __slots__ = ('function', 'args')
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = tuple(args)
+        self.depth = max((arg.depth for arg in self.args), default=0) + 1
+
+    def resolve(self, symbols):
+        for arg in self.args:
+            yield arg.resolve(symbols)
+
+    def infer(self, opt):
+        for arg in self.args:
+            arg.infer(opt)
+        return None
+
+    # Тело, которое не оптимизировано на уровне 2 (слишком глубокое), целые
+    # не ограничивает, поэтому в него они передаются вещественными
+    def optimize(self, opt):
+        limit = EXACT_INT_LIMIT if self.function.bounds_ints else 0
+        self.args = tuple(bound_int(arg.optimize(opt), opt, limit) for arg in self.args)
+        return self
+
+    def evaluate(self, frame):
+        return self.function.invoker('tree')(tuple([arg.evaluate(frame) for arg in self.args]))
+
+    def emit(self, code):
+        for arg in self.args:
+            yield arg.emit(code)
+        code.emit(OP_INVOKE, code.constant(self.function), len(self.args))
+
+    def compile(self, frame):
+        call = self.function.invoker('closure')
+        args = [arg.compile(frame) for arg in self.args]
+        def call_expr():
+            return call(tuple([arg() for arg in args]))
+        return call_expr
+
+    def to_python(self, gen):
+        args = [arg.to_python(gen) for arg in self.args]
+        return f"f_{self.function.name}({', '.join([*args, gen.call_depth])})"
+
+    def format(self):
+        parts = []
+        for arg in self.args:
+            parts.append((yield arg.format()))
+        return f"{self.function.name}({', '.join(parts)})"
+
+def divide(left, right):
+    if right == 0:
+        raise ZeroDivisionError("Division by zero")
+    return left / right
+
+# Функции бинарных операторов для evaluate()
+BINARY_FUNCTIONS = {
+    ord('+'): operator.add,
+    ord('-'): operator.sub,
+    ord('*'): operator.mul,
+    ord('/'): divide,
+    TOKEN_EQ: operator.eq,
+    TOKEN_NE: operator.ne,
+    TOKEN_LT: operator.lt,
+    TOKEN_LE: operator.le,
+    TOKEN_GT: operator.gt,
+    TOKEN_GE: operator.ge,
+}
+
+# Классы узлов для операторов с сокращённым вычислением
+LOGICAL_NODES = {
+    TOKEN_AND: AndExprAST,
+    TOKEN_OR: OrExprAST,
+}
+
+# Создаёт узел бинарного оператора
+def new_binary_expr(operator, lhs, rhs):
+    return LOGICAL_NODES.get(operator, BinaryExprAST)(operator, lhs, rhs)
+
+def compile_divide(left, right):
+    def divide():
+        left_value = left()
+        right_value = right()
+        if right_value == 0:
+            raise ZeroDivisionError("Division by zero")
+        return left_value / right_value
+    return divide
+
+def compile_and(left, right):
+    def and_expr():
+        return left() and right()
+    return and_expr
+
+def compile_or(left, right):
+    def or_expr():
+        return left() or right()
+    return or_expr
+
+# Построители замыканий для бинарных операторов
+BINARY_CLOSURES = {
+    ord('+'): lambda l, r: lambda: l() + r(),
+    ord('-'): lambda l, r: lambda: l() - r(),
+    ord('*'): lambda l, r: lambda: l() * r(),
+    ord('/'): compile_divide,
+    TOKEN_EQ: lambda l, r: lambda: l() == r(),
+    TOKEN_NE: lambda l, r: lambda: l() != r(),
+    TOKEN_LT: lambda l, r: lambda: l() < r(),
+    TOKEN_LE: lambda l, r: lambda: l() <= r(),
+    TOKEN_GT: lambda l, r: lambda: l() > r(),
+    TOKEN_GE: lambda l, r: lambda: l() >= r(),
+    TOKEN_AND: compile_and,
+    TOKEN_OR: compile_or,
+}
+
+# Таблица имён: номер ячейки кадра и вид ('int' или 'array') каждой переменной.
+# Объявления бывают только на верхнем уровне и исполняются по порядку, поэтому
+# вид имени в каждой точке программы известен до исполнения.
+class SymbolTable:
+    def __init__(self):
+        self.slots = {}  # Имя -> номер ячейки
+        self.kinds = {}  # Имя -> 'int' или 'array'
+        self.functions = {}  # Имя -> Function
+        self.shapes = {}  # Имя массива -> размеры измерений
+
+    def declare(self, name, kind):
+        if name not in self.slots:
+            self.slots[name] = len(self.slots)
+        self.kinds[name] = kind
+        return self.slots[name]
+
+    def lookup(self, name, kind):
+        found = self.kinds.get(name)
+        if found == kind:
+            return self.slots[name]
+        if kind == 'array':
+            raise RuntimeError(f"Unknown array name: {name}")
+        if found == 'array':
+            raise RuntimeError(f"Array {name} used without index")
+        raise RuntimeError(f"Unknown variable name: {name}")
+
+    # Новый кадр: по ячейке на каждую переменную
+    def new_frame(self):
+        return [None] * len(self.slots)
+
+    def copy(self):
+        symbols = SymbolTable()
+        symbols.slots = dict(self.slots)
+        symbols.kinds = dict(self.kinds)
+        symbols.functions = dict(self.functions)
+        symbols.shapes = dict(self.shapes)
+        return symbols
+
+# Движок исполнения обходом дерева: вызывает evaluate() у каждого выражения
+class TreeEngine:
+    def __init__(self, frame):
+        self.frame = frame
+
+    # Слишком глубокие выражения исполняет VM, чтобы не превысить предел рекурсии
+    def execute(self, ast):
+        if ast.depth > RECURSION_DEPTH_LIMIT:
+            return VM(self.frame).execute(ast)
+        return ast.evaluate(self.frame)
+
+    # Функция без аргументов, исполняющая выражение (для многократного исполнения, см. Program)
+    def prepare(self, ast):
+        if ast.depth > RECURSION_DEPTH_LIMIT:
+            return VM(self.frame).prepare(ast)
+        return partial(ast.evaluate, self.frame)
+
+# Движок исполнения замыканиями: каждое выражение верхнего уровня один раз
+# компилируется в замыкание, которое затем вызывается.
+class ClosureEngine:
+    def __init__(self, frame):
+        self.frame = frame
+
+    def execute(self, ast):
+        return self.prepare(ast)()
+
+    def prepare(self, ast):
+        if ast.depth > RECURSION_DEPTH_LIMIT:
+            return VM(self.frame).prepare(ast)
+        return ast.compile(self.frame)
+
+# Запоминает в узле позицию его начала, если она ещё не задана
+def set_position(node, line, column):
+    if node and node.line is None:
+        node.line = line
+        node.column = column
+    return node
+
+# Приоритеты бинарных операторов
+BINARY_PRECEDENCE = {
+    ord('+'): 10,
+    ord('-'): 10,
+    ord('*'): 20,
+    ord('/'): 20,
+    TOKEN_EQ: 5,
+    TOKEN_NE: 5,
+    TOKEN_LT: 15,
+    TOKEN_LE: 15,
+    TOKEN_GT: 15,
+    TOKEN_GE: 15,
+    TOKEN_AND: 3,
+    TOKEN_OR: 1
+}
+
+# Доступные режимы лексера
+LEXERS = {
+    'stream': Lexer,
+    'fast': FastLexer,
+    'parallel': ParallelLexer,
+}
+
+# Доступные движки исполнения выражений верхнего уровня
+ENGINES = {
+    'tree': TreeEngine,
+    'vm': VM,
+    'closure': ClosureEngine,
+}
+
+# Парсер X3. Всё состояние разбора (лексер, текущий токен, таблица имён)
+# хранится в экземпляре, поэтому несколько программ можно разбирать
+# независимо, в том числе из разных потоков.
+# Методы разбора вложенных конструкций - генераторы: разбор дочерней
+# конструкции выдаётся через yield и выполняется trampoline(), поэтому
+# глубина вложенности скобок и блоков не ограничена пределом рекурсии Python.
+class Parser:
+    def __init__(self, input_stream, lexer_mode='stream', symbols=None):
+        self.lexer = LEXERS[lexer_mode](input_stream)
+        self.current_token = None
+        self.symbols = SymbolTable() if symbols is None else symbols
+
+    def get_next_token(self):
+        self.current_token = self.lexer.get_token()
+        try:
+            token_char = chr(self.current_token)
+        except:
+            token_char = self.current_token
+        return self.current_token
+
+    def parse_expression(self):
+        lhs = yield self.parse_primary()
+        if not lhs:
+            raise RuntimeError("Error in parse_expression")
+        if self.get_token_precedence() < 0:
             return lhs
-        bin_op = current_token
-        get_next_token()
-        rhs = parse_primary()
-        if not rhs:
-            raise RuntimeError("Expected right-hand side expression")
-        next_prec = get_token_precedence()
-        if token_prec < next_prec:
-            rhs = parse_bin_op_rhs(token_prec + 1, rhs)
-            if not rhs:
-                raise RuntimeError("Expected right-hand side expression")
-        lhs = BinaryExprAST(bin_op, lhs, rhs)
-
-def parse_block():
-    get_next_token()
-    expressions = []
-    while current_token != ord('}') and current_token != TOKEN_EOF:
-        if current_token == ord(';'):
-            get_next_token()
-            continue
-        expr = parse_expression()
+        return (yield self.parse_bin_op_rhs(0, lhs))
+
+    def parse_number_expr(self):
+        result = NumberExprAST(self.lexer.num_val)
+        self.get_next_token()
+        return result
+
+    def parse_string_expr(self):
+        result = StringExprAST(self.lexer.string_val)
+        self.get_next_token()
+        return result
+
+    def parse_paren_expr(self):
+        self.get_next_token()
+        expression = yield self.parse_expression()
+        if not expression:
+            raise RuntimeError("Error in parse_expression")
+        if self.current_token != ord(')'):
+            raise RuntimeError("Expected ')'")
+        self.get_next_token()
+        return expression
+
+    def parse_identifier_expr(self):
+        identifier_name = self.lexer.identifier_str
+        self.get_next_token()
+        if self.current_token == ord('('):
+            return (yield self.parse_call_expr(identifier_name))
+        if self.current_token == ord('['):
+            indexes = []
+            while self.current_token == ord('['):
+                self.get_next_token()
+                indexes.append((yield self.parse_expression()))
+                if self.current_token != ord(']'):
+                    raise RuntimeError("Expected ']' after array index")
+                self.get_next_token()
+            index = indexes[0] if len(indexes) == 1 else StridedIndexExprAST(identifier_name, indexes)
+            if self.current_token == ord('='):
+                self.get_next_token()
+                expr = yield self.parse_expression()
+                return VariableAssignmentExprAST(identifier_name, expr, index)
+            return ArrayExprAST(identifier_name, index)
+        if self.current_token == ord('='):
+            self.get_next_token()
+            expr = yield self.parse_expression()
+            return VariableAssignmentExprAST(identifier_name, expr)
+        return VariableExprAST(identifier_name)
+
+    # Вызов встроенной операции или функции программы: имя(аргумент, ...).
+    # Аргумент-массив встроенной операции - имя массива (часть с начала) или имя[начало]
+    def parse_call_expr(self, name):
+        function = self.symbols.functions.get(name)
+        if name not in ARRAY_BUILTINS and function is None:
+            raise RuntimeError(f"Unknown function: {name}")
+        self.get_next_token()
+        args = []
+        while self.current_token != ord(')'):
+            if args:
+                if self.current_token != ord(','):
+                    raise RuntimeError("Expected ',' or ')' in argument list")
+                self.get_next_token()
+            args.append((yield self.parse_expression()))
+        self.get_next_token()
+        if function is not None:
+            if len(args) != len(function.params):
+                raise RuntimeError(f"Wrong number of arguments for {name}")
+            return CallExprAST(function, args)
+        params = ARRAY_BUILTINS[name][1]
+        if not len(params) <= len(args) <= len(params) + 1:
+            raise RuntimeError(f"Wrong number of arguments for {name}")
+        for i, param in enumerate(params):
+            if param != 'a':
+                continue
+            if type(args[i]) is VariableExprAST:
+                start = set_position(NumberExprAST(0.0), args[i].line, args[i].column)
+                args[i] = set_position(ArrayExprAST(args[i].name, start), args[i].line, args[i].column)
+            elif type(args[i]) is not ArrayExprAST:
+                raise RuntimeError(f"Expected array as argument {i + 1} of {name}")
+        return BuiltinCallExprAST(name, args)
+
+    def parse_while_expr(self):
+        self.get_next_token()
+        if self.current_token != ord('('):
+            raise RuntimeError("Expected '('")
+        self.get_next_token()
+        condition = yield self.parse_expression()
+        if not condition:
+            raise RuntimeError("Expected condition")
+        if self.current_token != ord(')'):
+            raise RuntimeError("Expected ')'")
+        self.get_next_token()
+        if self.current_token != ord('{'):
+            raise RuntimeError("Expected '{'")
+        body = yield self.parse_block()
+        if not body:
+            raise RuntimeError("Expected body")
+        return WhileExprAST(condition, body)
+
+    def parse_print_expr(self):
+        self.get_next_token()
+        expr = yield self.parse_expression()
         if not expr:
             raise RuntimeError("Expected expression")
-        expressions.append(expr)
-        if current_token != ord(';'):
-            raise RuntimeError("Expected ';' at the end of expression")
-        get_next_token()
-    if current_token != ord('}'):
-        raise RuntimeError("Expected '}' at the end of block")
-    get_next_token()
-    if len(expressions) == 1:
-        return expressions[0]
-    return BlockExprAST(expressions)
-
-def parse_if_expr():
-    get_next_token()
-    if current_token != ord('('):
-        raise RuntimeError("Expected '(' after 'if'")
-    get_next_token()
-    condition = parse_expression()
-    if not condition:
-        raise RuntimeError("Expected condition")
-    if current_token != ord(')'):
-        raise RuntimeError("Expected ')' after condition")
-    get_next_token()
-    if current_token != ord('{'):
-        raise RuntimeError("Expected '{' after 'if'")
-    then_expr = parse_block()
-    if not then_expr:
-        raise RuntimeError("Expected then expression")
-    return IfExprAST(condition, then_expr)
-
-def parse_int_decl():
-    get_next_token()
-    if current_token != TOKEN_IDENTIFIER:
-        raise RuntimeError("Expected identifier after 'int'")
-    identifier_name = lexer.identifier_str
-    get_next_token()
-    if current_token == ord('['):
-        get_next_token()
-        if current_token != TOKEN_NUMBER:
-            raise RuntimeError("Expected number in array declaration")
-        array_size = int(lexer.num_val)
-        get_next_token()
-        if current_token != ord(']'):
-            raise RuntimeError("Expected ']' after array size")
-        get_next_token()
-        return ArrayDeclarationExprAST(identifier_name, array_size)
-    if current_token != ord('='):
-        raise RuntimeError("Expected '=' after identifier")
-    get_next_token()
-    expr = parse_expression()
-    if not expr:
-        raise RuntimeError("Expected expression")
-    return VariableDeclarationExprAST(identifier_name, expr)
-
-def handle_file(filename):
-    global lexer
-    with open(filename, 'r') as file:
-        lexer = Lexer(file)
+        return PrintExprAST(expr)
+
+    def parse_endl_expr(self):
+        self.get_next_token()
+        return EndlExprAST()
+
+    def parse_input_expr(self):
+        self.get_next_token()
+        if self.current_token != TOKEN_IDENTIFIER:
+            raise RuntimeError("Expected identifier")
+        identifier_name = self.lexer.identifier_str
+        self.get_next_token()
+        return InputExprAST(identifier_name)
+
+    def parse_primary(self):
+        line, column = self.lexer.line, self.lexer.column
+        if self.current_token == TOKEN_IDENTIFIER:
+            return set_position((yield self.parse_identifier_expr()), line, column)
+        if self.current_token == TOKEN_NUMBER:
+            return set_position((yield self.parse_number_expr()), line, column)
+        if self.current_token == TOKEN_STRING:
+            return set_position((yield self.parse_string_expr()), line, column)
+        if self.current_token == ord('('):
+            return set_position((yield self.parse_paren_expr()), line, column)
+        if self.current_token == TOKEN_IF:
+            return set_position((yield self.parse_if_expr()), line, column)
+        if self.current_token == TOKEN_WHILE:
+            return set_position((yield self.parse_while_expr()), line, column)
+        if self.current_token == TOKEN_PRINT:
+            return set_position((yield self.parse_print_expr()), line, column)
+        if self.current_token == TOKEN_ENDL:
+            return set_position((yield self.parse_endl_expr()), line, column)
+        if self.current_token == TOKEN_INPUT:
+            return set_position((yield self.parse_input_expr()), line, column)
+        return None
+
+    def get_token_precedence(self):
+        return BINARY_PRECEDENCE.get(self.current_token, -1)
+
+    # Разбор цепочки бинарных операторов методом сдвига-свёртки на явных
+    # стеках операндов и операторов: оператор сворачивается, когда следующий
+    # не выше его по приоритету, поэтому операторы одного приоритета
+    # левоассоциативны. Длина цепочки не ограничена пределом рекурсии Python.
+    def parse_bin_op_rhs(self, expr_prec, lhs):
+        operands = [lhs]
+        operators = []  # (оператор, приоритет)
         while True:
-            get_next_token()
-            if current_token == TOKEN_EOF:
+            token_prec = self.get_token_precedence()
+            if token_prec < expr_prec:
                 break
-            if current_token == ord(';'):
+            while operators and operators[-1][1] >= token_prec:
+                self.reduce_binary(operands, operators)
+            operators.append((self.current_token, token_prec))
+            self.get_next_token()
+            rhs = yield self.parse_primary()
+            if not rhs:
+                raise RuntimeError("Expected right-hand side expression")
+            operands.append(rhs)
+        while operators:
+            self.reduce_binary(operands, operators)
+        return operands[0]
+
+    # Заменяет два верхних операнда выражением с верхним оператором
+    def reduce_binary(self, operands, operators):
+        bin_op = operators.pop()[0]
+        rhs = operands.pop()
+        lhs = operands.pop()
+        operands.append(set_position(new_binary_expr(bin_op, lhs, rhs), lhs.line, lhs.column))
+
+    # declarations - блок является телом функции, в нём можно объявлять переменные
+    def parse_block(self, declarations=False):
+        line, column = self.lexer.line, self.lexer.column
+        self.get_next_token()
+        expressions = []
+        while self.current_token != ord('}') and self.current_token != TOKEN_EOF:
+            if self.current_token == ord(';'):
+                self.get_next_token()
                 continue
-            ast = None
-            if current_token == TOKEN_INT:
-                ast = parse_int_decl()
+            if declarations and self.current_token == TOKEN_INT:
+                expr = yield self.parse_int_decl(local=True)
             else:
-                ast = parse_expression()
-            print(ast)
+                expr = yield self.parse_expression()
+            if not expr:
+                raise RuntimeError("Expected expression")
+            expressions.append(expr)
+            if self.current_token != ord(';'):
+                raise RuntimeError("Expected ';' at the end of expression")
+            self.get_next_token()
+        if self.current_token != ord('}'):
+            raise RuntimeError("Expected '}' at the end of block")
+        self.get_next_token()
+        if len(expressions) == 1:
+            return expressions[0]
+        return set_position(BlockExprAST(expressions), line, column)
+
+    def parse_if_expr(self):
+        self.get_next_token()
+        if self.current_token != ord('('):
+            raise RuntimeError("Expected '(' after 'if'")
+        self.get_next_token()
+        condition = yield self.parse_expression()
+        if not condition:
+            raise RuntimeError("Expected condition")
+        if self.current_token != ord(')'):
+            raise RuntimeError("Expected ')' after condition")
+        self.get_next_token()
+        if self.current_token != ord('{'):
+            raise RuntimeError("Expected '{' after 'if'")
+        then_expr = yield self.parse_block()
+        if not then_expr:
+            raise RuntimeError("Expected then expression")
+        return IfExprAST(condition, then_expr)
+
+    # Объявление переменной, массива или функции. cache_size - размер кеша
+    # функции pure; local - объявление в теле функции
+    def parse_int_decl(self, cache_size=None, local=False):
+        line, column = self.lexer.line, self.lexer.column
+        self.get_next_token()
+        if self.current_token != TOKEN_IDENTIFIER:
+            raise RuntimeError("Expected identifier after 'int'")
+        identifier_name = self.lexer.identifier_str
+        self.get_next_token()
+        if self.current_token == ord('('):
+            if local:
+                raise RuntimeError("Functions can be declared only at top level")
+            return (yield self.parse_function_decl(identifier_name, cache_size, line, column))
+        if cache_size is not None:
+            raise RuntimeError("Expected function declaration after 'pure'")
+        if self.current_token == ord('['):
+            shape = []
+            while self.current_token == ord('['):
+                self.get_next_token()
+                if self.current_token != TOKEN_NUMBER:
+                    raise RuntimeError("Expected number in array declaration")
+                shape.append(int(self.lexer.num_val))
+                self.get_next_token()
+                if self.current_token != ord(']'):
+                    raise RuntimeError("Expected ']' after array size")
+                self.get_next_token()
+            return set_position(ArrayDeclarationExprAST(identifier_name, shape), line, column)
+        if self.current_token != ord('='):
+            raise RuntimeError("Expected '=' after identifier")
+        self.get_next_token()
+        expr = yield self.parse_expression()
+        if not expr:
+            raise RuntimeError("Expected expression")
+        return set_position(VariableDeclarationExprAST(identifier_name, expr), line, column)
+
+    # int имя(параметр, ...) { тело }. Функция становится известной до разбора
+    # тела, так что она может вызывать саму себя
+    def parse_function_decl(self, name, cache_size, line, column):
+        if name in ARRAY_BUILTINS or name in self.symbols.functions:
+            raise RuntimeError(f"Function already declared: {name}")
+        self.get_next_token()
+        params = []
+        while self.current_token != ord(')'):
+            if params:
+                if self.current_token != ord(','):
+                    raise RuntimeError("Expected ',' or ')' in parameter list")
+                self.get_next_token()
+            if self.current_token != TOKEN_IDENTIFIER:
+                raise RuntimeError("Expected parameter name")
+            if self.lexer.identifier_str in params:
+                raise RuntimeError(f"Duplicate parameter name: {self.lexer.identifier_str}")
+            params.append(self.lexer.identifier_str)
+            self.get_next_token()
+        self.get_next_token()
+        if self.current_token != ord('{'):
+            raise RuntimeError("Expected '{'")
+        function = Function(name, params, cache_size)
+        self.symbols.functions[name] = function
+        function.body = yield self.parse_block(declarations=True)
+        return set_position(FunctionDeclarationExprAST(function), line, column)
+
+    # pure [(размер кеша)] int имя(параметр, ...) { тело }
+    def parse_pure_decl(self):
+        self.get_next_token()
+        cache_size = MEMO_CACHE_SIZE
+        if self.current_token == ord('('):
+            self.get_next_token()
+            if self.current_token != TOKEN_NUMBER or self.lexer.num_val < 1:
+                raise RuntimeError("Expected cache size after 'pure ('")
+            cache_size = int(self.lexer.num_val)
+            self.get_next_token()
+            if self.current_token != ord(')'):
+                raise RuntimeError("Expected ')' after cache size")
+            self.get_next_token()
+        if self.current_token != TOKEN_INT:
+            raise RuntimeError("Expected function declaration after 'pure'")
+        return (yield self.parse_int_decl(cache_size))
+
+    # Разбирает следующее выражение верхнего уровня; в конце файла возвращает None
+    def parse_top_level(self):
+        while True:
+            self.get_next_token()
+            if self.current_token == TOKEN_EOF:
+                return None
+            if self.current_token == ord(';'):
+                continue
+            if self.current_token == TOKEN_INT:
+                return trampoline(self.parse_int_decl())
+            if self.current_token == TOKEN_PURE:
+                return trampoline(self.parse_pure_decl())
+            return trampoline(self.parse_expression())
+
+    # Разбирает всю программу и разрешает в ней имена.
+    # Возвращает список выражений верхнего уровня; таблица имён остаётся в self.symbols.
+    def parse_program(self):
+        program = []
+        while True:
+            ast = self.parse_top_level()
+            if ast is None:
+                return program
+            if not ast:
+                raise RuntimeError("Error parsing expression")
+            trampoline(ast.resolve(self.symbols))
+            program.append(ast)
+
+# Переводит разобранную программу X3 в исходный код функции на Python
+def transpile(program):
+    gen = PythonGenerator()
+    for ast in program:
+        gen.top_level(ast)
+    return gen.source()
+
+# Интерпретатор X3: параметры запуска и таблица имён загруженной программы.
+# Экземпляры не делят между собой состояние разбора; вывод и ввод
+# (output_sink, input_reader) общие для процесса.
+class Interpreter:
+    def __init__(self, lexer_mode='stream', engine='tree', opt_level=0, cache=None):
+        self.lexer_mode = lexer_mode
+        self.engine = engine
+        self.opt_level = opt_level
+        self.cache = cache  # Дисковый кеш разобранных программ (cache.py); None - без кеша
+        self.symbols = SymbolTable()
+        self.frame = []  # Значения переменных по номерам ячеек из symbols
+        self.runner = None
+
+    # Разбирает и оптимизирует текст программы. Результат вместе с таблицей имён
+    # сохраняется в кеше, и повторный запуск того же текста обходится
+    # без лексера, парсера и оптимизатора.
+    def load_program(self, source, filename):
+        key = cache_key(source, self.opt_level, ExprAST.__module__)
+        if self.cache is not None:
+            cached = self.cache.load(filename, key)
+            if cached is not None:
+                program, self.symbols = cached
+                return program
+        # Параллельный лексер сам отображает файл в память, остальные разбирают прочитанный текст
+        with open(filename, 'r') if self.lexer_mode == 'parallel' else io.StringIO(source) as stream:
+            parser = Parser(stream, self.lexer_mode)
+            program = Optimizer(self.opt_level).optimize_program(parser.parse_program())
+        self.symbols = parser.symbols
+        if self.cache is not None:
+            self.cache.store(filename, key, (program, self.symbols))
+        return program
+
+    # Исполняет файл; возвращает False, если программа завершилась ошибкой
+    def handle_file(self, filename):
+        if self.engine == 'python':
+            return self.handle_file_python(filename)
+        with open(filename, 'r') as file:
+            source = file.read()
+        try:
+            program = self.load_program(source, filename)
+        except Exception as e:
+            output_sink.line(f"Error : {e}")
+            return False
+        self.frame = self.symbols.new_frame()
+        self.runner = ENGINES[self.engine](self.frame)
+        return self.execute_program(program)
+
+    # Исполняет выражения верхнего уровня, выводя перед каждым его AST.
+    # При ошибке выводит её и возвращает False.
+    def execute_program(self, program):
+        for ast in program:
+            output_sink.echo(ast)
+            try:
+                self.runner.execute(ast)
+            except Exception as e:
+                output_sink.line(f"Error : {e}")
+                output_sink.line(f"AST:  {ast}")
+                return False
+        return True
+
+    # Исполняет программу, переведённую в Python. Код Python и его объект кода
+    # (marshal) сохраняются в дисковом кеше вместе с таблицей имён, поэтому повторный
+    # запуск той же программы обходится без лексера, парсера и генерации кода.
+    def handle_file_python(self, filename, emit_python=False):
+        with open(filename, 'r') as file:
+            source = file.read()
+        key = cache_key(source, self.opt_level, ExprAST.__module__, 'python')
+        cached = None if self.cache is None else self.cache.load(filename, key)
+        if cached is not None:
+            python_source, marshalled, self.symbols = cached
+            code = marshal.loads(marshalled)
+        else:
             try:
-                if ast:
-                    ast.evaluate()
-                else:
-                    raise RuntimeError("Error parsing expression")
+                program = self.load_program(source, filename)
             except Exception as e:
-                print("Error :", e)
-                print("AST: ", ast)
+                output_sink.line(f"Error : {e}")
+                return False
+            if any(ast.depth > PYTHON_DEPTH_LIMIT for ast in program):
+                if emit_python:
+                    output_sink.line(f"Error : Program is nested deeper than {PYTHON_DEPTH_LIMIT} levels")
+                    return False
+                # Такую программу компилятор Python не примет; её исполняет VM
+                self.frame = self.symbols.new_frame()
+                self.runner = VM(self.frame)
+                return self.execute_program(program)
+            python_source = transpile(program)
+            code = compile(python_source, filename, 'exec')
+            if self.cache is not None:
+                self.cache.store(filename, key, (python_source, marshal.dumps(code), self.symbols))
+        if emit_python:
+            output_sink.write(python_source)
+            return True
+        return run_python_code(code, self.symbols.functions)
+
+    # Разбирает текст как продолжение уже исполненной программы: имена
+    # разрешаются по текущей таблице имён, новые переменные получают новые
+    # ячейки в конце кадра. Прежний текст повторно не разбирается и не исполняется.
+    # Оптимизация не выше уровня 1: уровню 2 нужны все присваивания программы.
+    def compile_incremental(self, source):
+        symbols = self.symbols.copy()  # При ошибке разбора таблица имён не меняется
+        program = Parser(io.StringIO(source), self.lexer_mode, symbols).parse_program()
+        program = Optimizer(min(self.opt_level, 1)).optimize_program(program)
+        self.symbols = symbols
+        self.frame.extend([None] * (len(symbols.slots) - len(self.frame)))
+        return program
+
+    # Интерактивный режим. Программа filename, если задана, сначала исполняется,
+    # затем каждое введённое выражение разбирается и исполняется над тем же
+    # кадром переменных. Ввод продолжается, пока не закрыты все скобки { }.
+    def repl(self, filename=None):
+        if self.engine not in ENGINES:
+            raise RuntimeError(f"REPL does not support engine {self.engine}")
+        if filename:
+            self.handle_file(filename)
+        if self.runner is None:
+            self.runner = ENGINES[self.engine](self.frame)
+        if input_reader.stream is sys.stdin:
+            input_reader.configure(sys.stdin, interactive=True)  # Числа для read вводятся вместе с выражениями
+        while True:
+            output_sink.flush()
+            try:
+                source = self.read_input()
+            except EOFError:
+                output_sink.line()
                 return
+            try:
+                program = self.compile_incremental(source)
+            except Exception as e:
+                output_sink.line(f"Error : {e}")
+                continue
+            for ast in program:
+                try:
+                    value = self.runner.execute(ast)
+                except Exception as e:
+                    output_sink.line(f"Error : {e}")
+                    break
+                if isinstance(ast, REPL_VALUE_NODES):
+                    output_sink.line(format_value(value))
+
+    # Читает строки, пока число открытых скобок { не сравняется с закрытыми
+    def read_input(self):
+        lines = [input(REPL_PROMPT)]
+        while brace_depth("\n".join(lines)) > 0:
+            output_sink.flush()
+            lines.append(input(REPL_CONTINUATION_PROMPT))
+        return "\n".join(lines)
+
+    # Выводит для каждой функции pure число попаданий и промахов её кеша
+    def memo_report(self, stream=sys.stderr):
+        print("Pure function caches", file=stream)
+        print(f"{'function':<20} {'hits':>10} {'misses':>10} {'size':>15}", file=stream)
+        for function in self.symbols.functions.values():
+            cache = function.cache
+            if cache is not None:
+                print(f"{function.name:<20} {cache.hits:>10} {cache.misses:>10} {f'{len(cache)}/{cache.size}':>15}",
+                      file=stream)
+
+    # Выводит оптимизированное AST программы без исполнения
+    def dump_ast(self, filename):
+        with open(filename, 'r') as file:
+            source = file.read()
+        for ast in self.load_program(source, filename):
+            output_sink.line(str(ast))
+
+# Программа, разобранная один раз для многократного исполнения (программный
+# интерфейс x3.py). Разбор, оптимизация и подготовка выражений движком
+# (байткод, замыкания или код Python) выполняются в конструкторе; run() только
+# возвращает кадр переменных в начальное состояние и исполняет готовые выражения.
+# Кадр у программы один, поэтому одновременно из нескольких потоков
+# один объект исполнять нельзя - каждому потоку нужна своя программа.
+# Вывод и ввод (output_sink, input_reader) общие для процесса, поэтому запуски
+# из разных потоков выполняются по очереди (PROGRAM_RUN_LOCK), а после запуска
+# их прежняя настройка восстанавливается.
+class Program:
+    def __init__(self, source, engine='tree', opt_level=0, lexer_mode='fast'):
+        if engine not in ENGINES and engine != 'python':
+            raise RuntimeError(f"Unknown engine: {engine}")
+        parser = Parser(io.StringIO(source), lexer_mode)
+        self.program = Optimizer(opt_level).optimize_program(parser.parse_program())
+        self.symbols = parser.symbols
+        self.frame = self.symbols.new_frame()
+        self.initial_frame = tuple(self.frame)
+        # Кеши функций pure: как и переменные, каждый запуск начинает с пустых
+        self.caches = [function.cache for function in self.symbols.functions.values() if function.cache is not None]
+        self.code = None  # Объект кода Python для движка python
+        self.statements = []  # (выражение, функция его исполнения) для остальных движков
+        if engine == 'python' and all(ast.depth <= PYTHON_DEPTH_LIMIT for ast in self.program):
+            self.code = compile(transpile(self.program), '<x3>', 'exec')
+        else:
+            # Слишком глубокую для компилятора Python программу исполняет VM
+            runner = ENGINES.get(engine, VM)(self.frame)
+            self.statements = [(ast, runner.prepare(ast)) for ast in self.program]
+
+    # Исполняет программу; числа для read берутся из inputs (строка или поток),
+    # вывод пишется в output (по умолчанию стандартный вывод) одним вызовом в конце.
+    # quiet=False - выводить эхо AST, как интерпретатор. Возвращает False, если
+    # программа завершилась ошибкой; ошибка выводится, как в handle_file.
+    def run(self, inputs='', output=None, quiet=True):
+        with PROGRAM_RUN_LOCK:
+            saved_output = output_sink.save()
+            saved_input = input_reader.save()
+            output_sink.configure(sys.stdout if output is None else output, 'exit', quiet)
+            input_reader.configure(io.StringIO(inputs) if isinstance(inputs, str) else inputs, interactive=False)
+            try:
+                for cache in self.caches:
+                    cache.clear()
+                if self.code is not None:
+                    return run_python_code(self.code, self.symbols.functions)
+                self.frame[:] = self.initial_frame
+                for ast, statement in self.statements:
+                    output_sink.echo(ast)
+                    try:
+                        statement()
+                    except Exception as e:
+                        output_sink.line(f"Error : {e}")
+                        output_sink.line(f"AST:  {ast}")
+                        return False
+                return True
+            finally:
+                try:
+                    output_sink.flush()
+                finally:
+                    output_sink.restore(saved_output)
+                    input_reader.restore(saved_input)
+
+# Запуски Program.run по одному: вывод и ввод у них общие
+PROGRAM_RUN_LOCK = threading.Lock()
+
+# Приглашения интерактивного режима
+REPL_PROMPT = "x3> "
+REPL_CONTINUATION_PROMPT = "... "
+
+# Выражения, значение которых интерактивный режим выводит после исполнения
+REPL_VALUE_NODES = (NumberExprAST, VariableExprAST, ArrayExprAST, BinaryExprAST, BuiltinCallExprAST, CallExprAST)
+
+# Разность числа открытых и закрытых фигурных скобок в тексте
+def brace_depth(source):
+    depth = 0
+    for kind, value, line, column in tokenize(source):
+        if kind == ord('{'):
+            depth += 1
+        elif kind == ord('}'):
+            depth -= 1
+    return depth
+
+# Прерывание программы пакетного режима по таймауту. Наследуется от
+# BaseException, чтобы его не перехватывала обработка ошибок X3.
+class BatchTimeout(BaseException):
+    pass
+
+def raise_batch_timeout(signum, frame):
+    raise BatchTimeout()
+
+# Исполняет одну программу пакета в процессе-исполнителе и возвращает её
+# результат и перехваченный вывод. Числа для read берутся из файла
+# <программа>.in, если он есть.
+def run_batch_script(filename, options):
+    set_array_backend(options['arrays'])
+    output = io.StringIO()
+    output_sink.configure(output, 'exit', options['quiet'])
+    input_filename = os.path.splitext(filename)[0] + '.in'
+    with open(input_filename, 'r') if os.path.exists(input_filename) else io.StringIO() as input_stream:
+        input_reader.configure(input_stream)
+        cache = ProgramCache(options['cache_dir']) if options['cache'] else None
+        interpreter = Interpreter(options['lexer'], options['engine'], options['opt_level'], cache)
+        timeout = options['timeout'] if hasattr(signal, 'setitimer') else None
+        if timeout:
+            signal.signal(signal.SIGALRM, raise_batch_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        start = time.perf_counter()
+        try:
+            status = 'ok' if interpreter.handle_file(filename) else 'error'
+        except BatchTimeout:
+            output_sink.line(f"Error : Timeout after {timeout} s")
+            status = 'timeout'
+        except Exception as e:
+            output_sink.line(f"Error : {e}")
+            status = 'error'
+        finally:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    seconds = time.perf_counter() - start
+    output_sink.flush()
+    return {'file': filename, 'status': status, 'seconds': seconds, 'output': output.getvalue()}
+
+BATCH_STATUSES = ('ok', 'error', 'timeout', 'crash')
+
+# Исполняет все программы *.X3 из каталога в пуле процессов (по умолчанию по
+# одному на ядро). Вывод каждой программы печатается целиком, в порядке имён
+# файлов, затем сводка. Возвращает число программ, завершившихся неуспешно.
+def run_batch(directory, options, jobs=None):
+    filenames = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                       if name.lower().endswith('.x3'))
+    counts = dict.fromkeys(BATCH_STATUSES, 0)
+    total_seconds = 0.0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(run_batch_script, filename, options) for filename in filenames]
+        for filename, future in zip(filenames, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'file': filename, 'status': 'crash', 'seconds': 0.0, 'output': f"Error : {e}\n"}
+            counts[result['status']] += 1
+            total_seconds += result['seconds']
+            output_sink.line(f"=== {result['file']}: {result['status']}, {result['seconds']:.3f} s")
+            output_sink.write(result['output'])
+            if result['output'] and not result['output'].endswith('\n'):
+                output_sink.line()
+    wall_seconds = time.perf_counter() - start
+    summary = ", ".join(f"{status} {counts[status]}" for status in BATCH_STATUSES)
+    output_sink.line(f"=== {len(filenames)} scripts: {summary}; "
+                     f"script time {total_seconds:.3f} s, wall time {wall_seconds:.3f} s")
+    return len(filenames) - counts['ok']
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        handle_file(sys.argv[1])
-    else:
-        print("Usage: main.py <filename>")
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Интерпретатор языка X3")
+    arg_parser.add_argument("filename", nargs='?', help="файл с программой на X3")
+    arg_parser.add_argument("--lexer", choices=LEXERS, default='stream',
+                            help="режим лексера: посимвольный (stream), быстрый (fast) или параллельный "
+                                 "для очень больших файлов (parallel)")
+    arg_parser.add_argument("--engine", choices=[*ENGINES, 'python'], default='tree',
+                            help="движок исполнения: обход AST (tree), байткод на стековой VM (vm), "
+                                 "скомпилированные замыкания (closure) или перевод в Python (python)")
+    arg_parser.add_argument("--arrays", choices=ARRAY_BACKENDS, default='array',
+                            help="хранение массивов: модуль array (array) или NumPy (numpy)")
+    arg_parser.add_argument("--opt-level", type=int, choices=(0, 1, 2), default=0,
+                            help="уровень оптимизации AST: 0 - нет, 1 - свёртка констант и мёртвых ветвей, "
+                                 "2 - ещё целочисленная арифметика и алгебраические упрощения")
+    arg_parser.add_argument("--dump-ast", action="store_true",
+                            help="вывести оптимизированное AST вместо исполнения")
+    arg_parser.add_argument("--emit-python", action="store_true",
+                            help="вывести код на Python, в который переводится программа, вместо исполнения")
+    arg_parser.add_argument("--input",
+                            help="файл с числами для read (по умолчанию стандартный ввод)")
+    arg_parser.add_argument("--output",
+                            help="файл для вывода программы (по умолчанию стандартный вывод)")
+    arg_parser.add_argument("--flush", choices=FLUSH_MODES,
+                            help="сброс буфера вывода: после каждой строки (line), при заполнении буфера (block) "
+                                 "или при завершении (exit); по умолчанию line для терминала, иначе block")
+    arg_parser.add_argument("--quiet", action="store_true",
+                            help="не выводить AST перед каждым выражением верхнего уровня")
+    arg_parser.add_argument("--cache-dir",
+                            help=f"каталог кеша разобранных программ (по умолчанию {CACHE_DIR_NAME} рядом с программой)")
+    arg_parser.add_argument("--no-cache", action="store_true",
+                            help="не читать и не записывать кеш разобранных программ")
+    arg_parser.add_argument("--profile", action="store_true",
+                            help="профилировать выражения (только --engine tree) и вывести отчёт в stderr")
+    arg_parser.add_argument("--profile-json",
+                            help="записать профиль выражений в JSON-файл")
+    arg_parser.add_argument("--memo-stats", action="store_true",
+                            help="вывести в stderr попадания и промахи кешей функций pure")
+    arg_parser.add_argument("--repl", action="store_true",
+                            help="интерактивный режим; программа filename, если задана, исполняется перед ним")
+    arg_parser.add_argument("--batch", metavar="DIR",
+                            help="исполнить все программы *.X3 из каталога в пуле процессов")
+    arg_parser.add_argument("--jobs", type=int,
+                            help="число процессов для --batch (по умолчанию по числу ядер)")
+    arg_parser.add_argument("--timeout", type=float,
+                            help="ограничение времени одной программы в --batch, в секундах")
+    args = arg_parser.parse_args()
+    if args.repl:
+        if args.batch:
+            arg_parser.error("--repl cannot be used with --batch")
+        if args.engine == 'python':
+            arg_parser.error("--repl does not support --engine python")
+    elif (args.filename is None) == (args.batch is None):
+        arg_parser.error("either a filename or --batch DIR is required")
+    if args.batch and (args.profile or args.profile_json):
+        arg_parser.error("--profile cannot be used with --batch")
+    if args.batch and args.memo_stats:
+        arg_parser.error("--memo-stats cannot be used with --batch")
+    cache = None if args.no_cache else ProgramCache(args.cache_dir)
+    try:
+        set_array_backend(args.arrays)
+    except RuntimeError as e:
+        arg_parser.error(str(e))
+    output_stream = open(args.output, 'w') if args.output else sys.stdout
+    output_sink.configure(output_stream, args.flush, args.quiet)
+    profiler = None
+    if args.profile or args.profile_json:
+        if args.engine != 'tree':
+            arg_parser.error("--profile works only with --engine tree")
+        profiler = Profiler()
+        profiler.install(ExprAST.__subclasses__())
+    if args.batch:
+        options = {
+            'lexer': args.lexer,
+            'engine': args.engine,
+            'opt_level': args.opt_level,
+            'arrays': args.arrays,
+            'quiet': args.quiet,
+            'cache': not args.no_cache,
+            'cache_dir': args.cache_dir,
+            'timeout': args.timeout,
+        }
+        failed = run_batch(args.batch, options, args.jobs)
+        output_sink.flush()
+        sys.exit(1 if failed else 0)
+    interpreter = Interpreter(args.lexer, args.engine, args.opt_level, cache)
+    input_stream = open(args.input, 'r') if args.input else None
+    if input_stream is not None:
+        input_reader.configure(input_stream)
+    try:
+        if args.repl:
+            interpreter.repl(args.filename)
+        elif args.dump_ast:
+            interpreter.dump_ast(args.filename)
+        elif args.emit_python:
+            interpreter.handle_file_python(args.filename, emit_python=True)
+        else:
+            interpreter.handle_file(args.filename)
+    finally:
+        if input_stream is not None:
+            input_stream.close()
+        if profiler:
+            output_sink.flush()
+            if args.profile:
+                profiler.report()
+            if args.profile_json:
+                profiler.dump_json(args.profile_json)
+        if args.memo_stats:
+            output_sink.flush()
+            interpreter.memo_report()
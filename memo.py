@@ -0,0 +1,50 @@
+from collections import OrderedDict
+
+# Размер кеша функции pure, если он не задан в объявлении
+MEMO_CACHE_SIZE = 4096
+
+# Признак отсутствия значения в кеше (значение функции может быть любым числом)
+MISSING = object()
+
+# Кеш результатов функции pure: кортеж аргументов -> значение.
+# Хранит не больше size значений; при переполнении вытесняется значение,
+# к которому дольше всего не обращались. hits и misses - число попаданий и промахов.
+class MemoCache:
+    def __init__(self, size=MEMO_CACHE_SIZE):
+        self.size = size
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    # Значение для аргументов key или MISSING
+    def get(self, key):
+        value = self.values.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.values.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.values[key] = value
+        if len(self.values) > self.size:
+            self.values.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.values.clear()
+        self.hits = 0
+        self.misses = 0
+
+# Оборачивает вызов call(args) кешем cache
+def memoized(call, cache):
+    def call_memoized(args):
+        value = cache.get(args)
+        if value is MISSING:
+            value = cache.put(args, call(args))
+        return value
+    return call_memoized
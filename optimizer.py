@@ -0,0 +1,164 @@
+import math
+import operator
+from lexer import *
+from trampoline import RECURSION_DEPTH_LIMIT
+
+# Операции для свёртки констант: те же вычисления, что и в evaluate()
+FOLD_OPERATORS = {
+    ord('+'): operator.add,
+    ord('-'): operator.sub,
+    ord('*'): operator.mul,
+    ord('/'): operator.truediv,
+    TOKEN_EQ: operator.eq,
+    TOKEN_NE: operator.ne,
+    TOKEN_LT: operator.lt,
+    TOKEN_LE: operator.le,
+    TOKEN_GT: operator.gt,
+    TOKEN_GE: operator.ge,
+    TOKEN_AND: lambda left, right: left and right,
+    TOKEN_OR: lambda left, right: left or right,
+}
+
+ARITHMETIC_OPERATORS = (ord('+'), ord('-'), ord('*'))
+
+# Наибольшее по модулю целое, до которого float представляет все целые точно
+EXACT_INT_LIMIT = 2 ** 53
+
+# Значение константы на уровне 2: целые вещественные константы становятся int,
+# чтобы счётчики, индексы и целочисленные выражения вычислялись в целых числах
+def int_literal(value):
+    if type(value) is float and value.is_integer() and abs(value) <= EXACT_INT_LIMIT:
+        return int(value)
+    return value
+
+# Значение целого выражения на уровне 2: целое больше limit по модулю становится
+# float, как если бы оно вычислялось в вещественных числах. Так целые точны, пока
+# их точно представляет float, но не растут без предела (x = x * x в цикле).
+def bounded_int(value, limit=EXACT_INT_LIMIT):
+    if type(value) is int and not -limit <= value <= limit:
+        try:
+            return float(value)
+        except OverflowError:
+            return math.inf if value > 0 else -math.inf
+    return value
+
+# Операторы условия цикла со счётчиком и знак шага, при котором цикл конечен
+COUNTED_OPERATORS = {TOKEN_LT: 1, TOKEN_LE: 1, TOKEN_GT: -1, TOKEN_GE: -1}
+
+# Итерации цикла со счётчиком while (i op bound) { ...; i = i + step }.
+# Когда i и bound - целые не больше EXACT_INT_LIMIT по модулю, а шаг целый,
+# все значения i точны, и число итераций считается заранее: возвращается range.
+# Иначе итерации перечисляет генератор, который сравнивает с границей
+# собственную копию счётчика, наращивая её так же, как цикл.
+def loop_trips(start, bound, op, step):
+    if (type(start) is int or type(start) is float and start.is_integer()) \
+            and (type(bound) is int or type(bound) is float) \
+            and abs(start) <= EXACT_INT_LIMIT and abs(bound) <= EXACT_INT_LIMIT:
+        if op == TOKEN_LT:
+            end = math.ceil(bound)
+        elif op == TOKEN_LE:
+            end = math.floor(bound) + 1
+        elif op == TOKEN_GT:
+            end = math.floor(bound)
+        else:
+            end = math.ceil(bound) - 1
+        return range(int(start), end, int(step))
+    return counted_steps(start, bound, FOLD_OPERATORS[op], step)
+
+def counted_steps(value, bound, compare, step):
+    while compare(value, bound):
+        yield value
+        value = value + step
+
+# Тип значения выражения - тип Python (float, int, bool, str).
+# None - тип неизвестен (значения разных типов).
+# NO_TYPE - значений ещё не видели (начальное состояние вывода типов).
+NO_TYPE = object()
+
+def join_types(left, right):
+    if left is NO_TYPE:
+        return right
+    if right is NO_TYPE:
+        return left
+    return left if left is right else None
+
+# Тип результата бинарного оператора по типам операндов
+def binary_type(op, left, right):
+    if op in ARITHMETIC_OPERATORS:
+        if left is float or right is float:
+            return float
+        if left is NO_TYPE or right is NO_TYPE:
+            return NO_TYPE
+        if left in (int, bool) and right in (int, bool):
+            return int
+        return None
+    if op == ord('/'):
+        return float
+    if op in (TOKEN_AND, TOKEN_OR):
+        return join_types(left, right)
+    return bool
+
+# Оптимизатор AST.
+# Уровень 1: свёртка констант, удаление if и while с ложным постоянным условием,
+# упрощение блоков, циклы со счётчиком (CountedWhileExprAST). Уровень 2: ещё целочисленная арифметика - целые константы
+# становятся int, и переменные, в которые записываются только целые, остаются
+# целыми (сложение, вычитание и умножение целых точны, деление даёт float),
+# а индексы массивов с целым типом не переводятся в int при каждом обращении.
+# Записываемые в переменные, аргументы и результаты функций целые больше
+# EXACT_INT_LIMIT по модулю становятся float (BoundedIntExprAST);
+# и алгебраические упрощения (x * 1, x + 0, x - x), для которых нужно знать тип x.
+# При этом считается, что значения конечны, а знак нуля не важен.
+class Optimizer:
+    def __init__(self, level):
+        self.level = level
+        self.slot_types = {}  # Номер ячейки -> тип значений переменной
+        self.changed = False
+        self.int_literals = False  # Целые константы становятся int (уровень 2 с выводом типов)
+        self.non_counters = set()  # Ячейки, в которые записывается не только константа или i = i ± c
+
+    def slot_type(self, slot):
+        return self.slot_types.get(slot, NO_TYPE)
+
+    # Переменная - счётчик: её значение меняется не быстрее чем на константу за запись
+    def is_counter(self, slot):
+        return slot not in self.non_counters
+
+    # Учитывает запись значения типа value_type в переменную;
+    # counter - записывается константа или приращение на константу
+    def store(self, slot, value_type, counter=False):
+        if not counter:
+            self.non_counters.add(slot)
+        joined = join_types(self.slot_type(slot), value_type)
+        if joined is not self.slot_type(slot):
+            self.slot_types[slot] = joined
+            self.changed = True
+
+    # Выводит типы переменных по всем записям в них, до неподвижной точки
+    def infer_program(self, program):
+        self.changed = True
+        while self.changed:
+            self.changed = False
+            for ast in program:
+                ast.infer(self)
+
+    # Выражения глубже RECURSION_DEPTH_LIMIT не оптимизируются. Если такое
+    # выражение есть, типы переменных не выводятся (записи в нём неизвестны),
+    # и упрощения уровня 2 не применяются; константы тоже остаются вещественными,
+    # иначе целые попали бы в неоптимизированное выражение, которое их не ограничивает.
+    def optimize_program(self, program):
+        if self.level <= 0:
+            return program
+        shallow = all(ast.depth <= RECURSION_DEPTH_LIMIT for ast in program)
+        if self.level >= 2 and shallow:
+            self.int_literals = True
+            self.infer_program(program)
+        return [ast.optimize(self) if ast.depth <= RECURSION_DEPTH_LIMIT else ast for ast in program]
+
+    # Свёртка бинарного оператора над константами; None, если свернуть нельзя
+    def fold(self, op, left, right):
+        if op == ord('/') and right == 0:
+            return None  # Деление на ноль остаётся ошибкой времени исполнения
+        try:
+            return bounded_int(FOLD_OPERATORS[op](left, right))
+        except TypeError:
+            return None
@@ -0,0 +1,84 @@
+import atexit
+import sys
+
+# Размер буфера вывода в символах для режима block
+OUTPUT_BUFFER_SIZE = 64 * 1024
+
+# Режимы сброса буфера:
+# line - после каждого перевода строки (endl, эхо AST, сообщения об ошибках);
+# block - когда буфер заполнен;
+# exit - только при завершении программы (и перед чтением ввода).
+FLUSH_MODES = ('line', 'block', 'exit')
+
+# Текст значения для print и эха REPL. Целые числа (их порождает вывод типов
+# оптимизатора на уровне 2, см. optimizer.py) выводятся так же, как вещественные, -
+# с ".0". Так выводятся значения на любом уровне: целое может попасть и в код,
+# который оптимизатор не обработал (слишком глубокие выражения, аргументы функций).
+def format_value(value):
+    if type(value) is int:
+        return f"{value}.0"
+    return str(value)
+
+# Буферизованный вывод программы X3 и эха AST.
+# Вместо вызова print() на каждое значение текст копится в списке и
+# записывается в поток одним вызовом write.
+class OutputSink:
+    def __init__(self):
+        self.configure(sys.stdout)
+
+    # stream - поток вывода; flush_mode None - line для терминала, иначе block.
+    # quiet - не выводить эхо AST перед выражениями верхнего уровня.
+    def configure(self, stream, flush_mode=None, quiet=False, buffer_size=OUTPUT_BUFFER_SIZE):
+        if flush_mode is None:
+            flush_mode = 'line' if stream.isatty() else 'block'
+        if flush_mode not in FLUSH_MODES:
+            raise RuntimeError(f"Unknown flush mode: {flush_mode}")
+        self.stream = stream
+        self.flush_mode = flush_mode
+        self.quiet = quiet
+        self.buffer_size = buffer_size if flush_mode == 'block' else sys.maxsize
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    # Текст и перевод строки
+    def line(self, text=''):
+        self.write(text + '\n')
+        if self.flush_mode == 'line':
+            self.flush()
+
+    # Эхо AST; в тихом режиме узел даже не переводится в строку
+    def echo(self, ast):
+        if not self.quiet:
+            self.line(str(ast))
+
+    # Настройка и ещё не выведенный текст - чтобы вернуть их методом restore
+    def save(self):
+        return dict(vars(self))
+
+    def restore(self, state):
+        vars(self).update(state)
+
+    # Забирает накопленный текст, не записывая его в поток (асинхронный вывод, aio.py)
+    def take(self):
+        text = ''.join(self.parts)
+        self.parts = []
+        self.size = 0
+        return text
+
+    def flush(self):
+        if self.parts:
+            self.stream.write(''.join(self.parts))
+            self.parts = []
+            self.size = 0
+        self.stream.flush()
+
+output_sink = OutputSink()
+
+# Остаток буфера выводится при любом завершении интерпретатора
+atexit.register(output_sink.flush)
@@ -0,0 +1,96 @@
+import json
+import sys
+import time
+
+# Сколько строк выводить в каждой таблице отчёта
+PROFILE_REPORT_SIZE = 10
+
+# Наибольшая длина текста узла в отчёте
+PROFILE_TEXT_WIDTH = 50
+
+def shorten(text):
+    if len(text) > PROFILE_TEXT_WIDTH:
+        return text[:PROFILE_TEXT_WIDTH - 3] + "..."
+    return text
+
+# Профилировщик движка tree.
+# install() подменяет evaluate() у классов AST обёрткой, которая считает
+# для каждого узла число вычислений, полное время (вместе с вложенными узлами)
+# и собственное время. Пока профилировщик не установлен, evaluate() не
+# меняется, поэтому без --profile он ничего не стоит.
+class Profiler:
+    def __init__(self):
+        self.records = {}  # Узел -> [число вычислений, полное время, собственное время]
+        self.children = []  # Время вложенных узлов для каждого вычисляемого узла
+        self.originals = {}  # Класс -> исходный evaluate
+
+    # Подменяет evaluate у классов и всех их подклассов
+    def install(self, classes):
+        for cls in classes:
+            if 'evaluate' in cls.__dict__:
+                self.originals[cls] = cls.evaluate
+                cls.evaluate = self.instrument(cls.evaluate)
+            self.install(cls.__subclasses__())
+
+    def uninstall(self):
+        for cls, evaluate in self.originals.items():
+            cls.evaluate = evaluate
+        self.originals = {}
+
+    def instrument(self, evaluate):
+        records = self.records
+        children = self.children
+        clock = time.perf_counter
+        def profiled(node, frame):
+            children.append(0.0)
+            start = clock()
+            try:
+                return evaluate(node, frame)
+            finally:
+                elapsed = clock() - start
+                nested = children.pop()
+                if children:
+                    children[-1] += elapsed
+                record = records.get(node)
+                if record is None:
+                    record = records[node] = [0, 0.0, 0.0]
+                record[0] += 1
+                record[1] += elapsed
+                record[2] += elapsed - nested
+        return profiled
+
+    # Записи профиля, отсортированные по убыванию полного времени
+    def entries(self):
+        entries = []
+        for node, (hits, total, own) in self.records.items():
+            entries.append({
+                'node': type(node).__name__,
+                'line': node.line,
+                'column': node.column,
+                'text': shorten(str(node)),
+                'hits': hits,
+                'total': total,
+                'self': own,
+            })
+        entries.sort(key=lambda entry: entry['total'], reverse=True)
+        return entries
+
+    def report(self, stream=sys.stderr):
+        entries = self.entries()
+        loops = [entry for entry in entries if entry['node'] in ('WhileExprAST', 'CountedWhileExprAST')]
+        statements = sorted(entries, key=lambda entry: entry['self'], reverse=True)
+        self.table(stream, "Hottest loops (by total time)", loops)
+        self.table(stream, "Hottest nodes (by self time)", statements)
+
+    def table(self, stream, title, entries):
+        print(title, file=stream)
+        print(f"{'line:col':>10} {'hits':>10} {'total, s':>10} {'self, s':>10}  node", file=stream)
+        for entry in entries[:PROFILE_REPORT_SIZE]:
+            position = f"{entry['line']}:{entry['column']}" if entry['line'] else "?"
+            print(f"{position:>10} {entry['hits']:>10} {entry['total']:>10.4f} {entry['self']:>10.4f}  {entry['text']}",
+                  file=stream)
+        print(file=stream)
+
+    def dump_json(self, filename):
+        with open(filename, 'w') as file:
+            json.dump(self.entries(), file, ensure_ascii=False, indent=1)
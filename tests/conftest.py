@@ -0,0 +1,12 @@
+import io
+import os
+import sys
+
+# Модули интерпретатора лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.abspath(os.path.dirname(__file__))))
+
+from output import output_sink
+
+# Общий вывод создаётся над sys.stdout, который pytest подменяет и закрывает
+# раньше, чем atexit сбрасывает буфер; тесты задают поток вывода сами
+output_sink.configure(io.StringIO(), 'exit')
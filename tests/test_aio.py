@@ -0,0 +1,63 @@
+import asyncio
+import time
+from aio import AsyncProgram
+
+FIB = """int fib(n) {
+    int r = n;
+    if (n >= 2) { r = fib(n - 1) + fib(n - 2); };
+    r;
+};
+print fib(%d); endl;
+"""
+
+# Исполняет программу запуском AsyncProgram; возвращает результат, вывод и число
+# переключений на цикл событий
+def run(program, chunks=()):
+    chunks = list(chunks)
+    written = []
+    switches = 0
+    async def read():
+        return chunks.pop(0) if chunks else ''
+    async def write(text):
+        nonlocal switches
+        switches += 1
+        written.append(text)
+    result = asyncio.run(program.run(read, write))
+    return result, ''.join(written), switches
+
+def test_recursion_yields_to_event_loop():
+    result, output, switches = run(AsyncProgram(FIB % 15, slice_ticks=100))
+    assert result and output == "610.0\n"
+    assert switches > 10  # около 2000 вызовов по 100 на квант
+
+def test_recursion_is_limited_by_budget():
+    result, output, _ = run(AsyncProgram(FIB % 24, budget=10))
+    assert not result
+    assert "Error : Iteration budget exceeded" in output
+
+def test_recursion_is_limited_by_time():
+    start = time.monotonic()
+    result, output, _ = run(AsyncProgram(FIB % 30, slice_ticks=100, time_limit=0.05))
+    assert not result
+    assert "Error : Time limit exceeded" in output
+    assert time.monotonic() - start < 1
+
+def test_pure_function_hits_also_count():
+    program = AsyncProgram("""pure int f(n) { n * 2; };
+int i = 0; int s = 0;
+while (i < 3) { s = s + f(1); i = i + 1; };
+print s; endl;
+""", budget=5)
+    result, output, _ = run(program)
+    assert not result and "Iteration budget exceeded" in output
+
+def test_loops_read_and_calls_interleave():
+    program = AsyncProgram("""int twice(x) { x * 2; };
+int n = 0; read n;
+int i = 0; int s = 0;
+while (i < n) { s = s + twice(i); i = i + 1; };
+print s; endl;
+""", slice_ticks=3)
+    result, output, switches = run(program, ["1", "0 "])
+    assert result and output == "90.0\n"
+    assert switches > 5
@@ -0,0 +1,78 @@
+import io
+import pytest
+import main
+from arena import NodeArena
+from codegen import run_python_code
+from output import output_sink
+
+# Цикл со счётчиком и несколькими выражениями тела (общие узлы в арене),
+# функции, массивы и ветвления
+SOURCE = """
+int sq(x) { x * x; };
+pure int fib(n) {
+    int r = n;
+    if (n >= 2) { r = fib(n - 1) + fib(n - 2); };
+    r;
+};
+int m[3][4];
+int a[5];
+int n = 5;
+int i = 0;
+int s = 0;
+while (i < n) {
+    a[i] = sq(i);
+    s = s + a[i] + fib(i);
+    i = i + 1;
+};
+i = 0;
+while (i < 3) { m[i][i + 1] = i; s = s + m[i][i + 1]; i = i + 1; };
+if (s > 10 && s < 1000) { print s; };
+endl;
+print sum(a); " "; print m[2][3]; endl;
+"""
+
+# Исполняет выражения верхнего уровня движком engine и возвращает вывод
+def run_nodes(program, symbols, engine):
+    output = io.StringIO()
+    output_sink.configure(output, 'exit', True)
+    if engine == 'python':
+        run_python_code(compile(main.transpile(program), '<x3>', 'exec'), symbols.functions)
+    else:
+        runner = main.ENGINES[engine](symbols.new_frame())
+        for ast in program:
+            runner.execute(ast)
+    output_sink.flush()
+    return output.getvalue()
+
+@pytest.mark.parametrize('opt_level', [0, 1, 2])
+@pytest.mark.parametrize('engine', [*main.ENGINES, 'python'])
+def test_round_trip_runs_on_every_engine(engine, opt_level):
+    parser = main.Parser(io.StringIO(SOURCE), 'fast')
+    program = main.Optimizer(opt_level).optimize_program(parser.parse_program())
+    expected = run_nodes(program, parser.symbols, engine)
+    rebuilt = NodeArena.from_nodes(program, main.ExprAST).to_nodes()
+    assert [str(ast) for ast in rebuilt] == [str(ast) for ast in program]
+    assert run_nodes(rebuilt, parser.symbols, engine) == expected
+    assert expected == "40.0\n30.0 2.0\n"
+
+def test_shared_node_is_stored_once():
+    parser = main.Parser(io.StringIO("int i = 0; int s = 0; while (i < 3) { s = s + i; s = s * 2; i = i + 1; };"), 'fast')
+    program = main.Optimizer(2).optimize_program(parser.parse_program())
+    loop = program[-1]
+    assert type(loop) is main.CountedWhileExprAST
+    arena = NodeArena.from_nodes(program, main.ExprAST)
+    rebuilt = arena.to_nodes()[-1]
+    assert rebuilt.loop_body.expressions[0] is rebuilt.body.expressions[0]
+    assert len(arena) == len({id(node) for node in walk(program)})
+
+def walk(nodes):
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        yield node
+        for name in main.slot_names(type(node)):
+            value = getattr(node, name, None)
+            if isinstance(value, main.ExprAST):
+                stack.append(value)
+            elif isinstance(value, tuple):
+                stack.extend(item for item in value if isinstance(item, main.ExprAST))
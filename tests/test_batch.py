@@ -0,0 +1,30 @@
+from main import run_batch_script
+from output import output_sink
+from inputs import input_reader
+
+OPTIONS = {
+    'lexer': 'stream',
+    'engine': 'tree',
+    'opt_level': 0,
+    'arrays': 'array',
+    'quiet': True,
+    'cache': False,
+    'cache_dir': None,
+    'timeout': None,
+}
+
+# Числа для read берутся из <программа>.in, и файл закрывается после запуска
+def test_batch_script_reads_and_closes_input_file(tmp_path):
+    script = tmp_path / 'twice.X3'
+    script.write_text("int x = 0; read x; print x * 2; endl;\n")
+    (tmp_path / 'twice.in').write_text("21\n")
+    saved_output = output_sink.save()
+    saved_input = input_reader.save()
+    try:
+        result = run_batch_script(str(script), OPTIONS)
+        assert input_reader.stream.closed
+    finally:
+        output_sink.restore(saved_output)
+        input_reader.restore(saved_input)
+    assert result['status'] == 'ok'
+    assert result['output'] == "42.0\n"
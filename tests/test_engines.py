@@ -0,0 +1,251 @@
+import io
+import pytest
+import x3
+from main import ENGINES as REPL_ENGINES, ExprAST, Interpreter, WhileExprAST, slot_names
+from output import output_sink
+
+ENGINES = ['tree', 'vm', 'closure', 'python']
+
+# Программы для сравнения движков: имя -> (текст, числа для read)
+PROGRAMS = {
+# Циклы со счётчиком (CountedWhileExprAST) и циклы, которые им не становятся
+    'counted_loop': ("""int i = 0; int s = 0;
+while (i < 10) { s = s + i; i = i + 1; };
+print s; " "; print i; endl;
+""", ''),
+    'counted_loop_float_bounds': ("""int i = 0.5; int s = 0;
+while (i < 7.25) { s = s + i; i = i + 2; };
+print s; " "; print i; endl;
+int j = 10; while (j > 2.5) { s = s + j; j = j - 3; };
+print s; " "; print j; endl;
+""", ''),
+    'counted_loop_variable_bounds': ("""int n = 0; read n;
+int i = 0; int j = 0; int s = 0;
+while (i < n) { j = 0; while (j <= (n - i - 1)) { s = s + j; j = j + 1; }; i = i + 1; };
+print s; endl;
+int k = n; while (k >= (0 - n)) { s = s - k; k = k - 2; };
+print s; " "; print k; endl;
+""", '7'),
+    'loop_writes_bound': ("""int n = 10; int i = 0; int s = 0;
+while (i < n) { n = n - 1; s = s + i; i = i + 1; };
+print s; " "; print n; endl;
+""", ''),
+    'loop_writes_counter': ("""int i = 0; int s = 0;
+while (i < 20) { i = i + 2; s = s + i; i = i + 1; };
+print s; endl;
+""", ''),
+    'loop_value': ("""int i = 0; int v = 0;
+v = while (i < 4) { i = i + 1; };
+print v; " "; v = while (i < 0) { i = i + 1; }; print v; endl;
+""", ''),
+
+# && и || с сокращённым вычислением
+    'short_circuit': ("""int x = 0; int calls = 0;
+x = 0 && (1 / 0); print x; endl;
+x = 1 || (1 / 0); print x; endl;
+x = (1 < 2) && (3 > 2); print x; endl;
+x = 0 || (calls = calls + 1); print x; " "; print calls; endl;
+x = 1 && (calls = calls + 1); print x; " "; print calls; endl;
+x = 1 && 0 || 2; print x; endl;
+""", ''),
+
+# Функции: рекурсия, pure, локальные переменные
+    'recursion': ("""int fib(n) {
+    int r = n;
+    if (n >= 2) { r = fib(n - 1) + fib(n - 2); };
+    r;
+};
+int depth(n) { int r = 0; if (n > 0) { r = depth(n - 1) + 1; }; r; };
+int sq(x) { x * x; };
+print fib(15); " "; print depth(400); " "; print sq(sq(3)); endl;
+""", ''),
+    'deep_recursion': ("""int depth(n) { int r = 0; if (n > 0) { r = depth(n - 1) + 1; }; r; };
+pure int steps(n) { int r = 0; if (n > 0) { r = steps(n - 1) + 2; }; r; };
+print depth(1500); " "; print steps(1200); " "; print steps(1300); endl;
+""", ''),
+    'pure_functions': ("""pure int fib(n) {
+    int r = n;
+    if (n >= 2) { r = fib(n - 1) + fib(n - 2); };
+    r;
+};
+pure(2) int g(x) { print x; " "; x + 1; };
+print fib(70); endl;
+print g(1) + g(1) + g(2) + g(3) + g(1); endl;
+""", ''),
+    'function_locals': ("""int total(k) {
+    int a[6];
+    int i = 0;
+    while (i < 3) { a[i * 2 + 1] = i * k; i = i + 1; };
+    sum(a);
+};
+int i = 100;
+print total(2) + total(3); " "; print i; endl;
+""", ''),
+
+# Многомерные массивы и выход индекса за границы
+    'grid_2d': ("""int g[6][5];
+int i = 0; int j = 0;
+while (i < 6) { j = 0; while (j < 5) { g[i][j] = i * 10 + j; j = j + 1; }; i = i + 1; };
+print g[5][4]; " "; print g[2][0]; " "; print g[7]; " "; print sum(g); endl;
+i = 1; int s = 0;
+while (i < 5) { j = 1; while (j < 4) { s = s + g[i - 1][j] + g[i + 1][j] + g[i][j - 1] + g[i][j + 1]; j = j + 1; }; i = i + 1; };
+print s; endl;
+fill(g[5], 1, 5); print g[1][0]; endl;
+""", ''),
+    'grid_3d': ("""int t[2][3][4];
+int i = 0; int j = 0; int k = 0;
+while (i < 2) { j = 0; while (j < 3) { k = 0; while (k < 4) { t[i][j][k] = i * 100 + j * 10 + k; k = k + 1; }; j = j + 1; }; i = i + 1; };
+print t[1][2][3]; " "; print t[0][1][2]; " "; print t[13]; endl;
+read t; print t[1][0][0]; " "; print max(t); endl;
+""", ' '.join(str(n) for n in range(24))),
+    'index_out_of_bounds_column': ("""int m[3][4];
+print m[0][3]; endl;
+print m[0][4]; endl;
+print 1; endl;
+""", ''),
+    'index_out_of_bounds_row': ("""int m[3][4]; int i = 3;
+m[i][0] = 1;
+""", ''),
+    'index_negative_3d': ("""int t[2][2][2];
+print t[1][1][1]; endl;
+print t[1][0 - 1][1]; endl;
+""", ''),
+    'index_out_of_bounds_in_function': ("""int at(i, j) { int m[2][2]; m[i][j]; };
+print at(1, 1); endl;
+print at(1, 2); endl;
+""", ''),
+
+# Целые на уровне 2: за пределами 2^53 значения становятся вещественными
+    'int_squaring_overflow': ("""int x = 3; int i = 0;
+while (i < 27) { x = x * x; i = i + 1; };
+print x > 1; endl; print x; endl;
+int y = 3; i = 0; while (i < 4) { y = y * y; i = i + 1; }; print y; endl;
+int z = 3; i = 0; while (i < 6) { z = z * z; i = i + 1; }; print z; endl;
+""", ''),
+    'int_doubling_overflow': ("""int d = 1; int i = 0;
+while (i < 2000) { d = d + d; i = i + 1; };
+print d; endl;
+""", ''),
+    'int_overflow_in_functions': ("""pure int q(n) { int r = 2; if (n > 0) { r = q(n - 1) * q(n - 1); }; r; };
+print q(5); endl; print q(200); endl;
+int sq(v) { v * v; };
+print sq(sq(sq(sq(sq(sq(sq(sq(sq(3))))))))); endl;
+""", ''),
+    'int_overflow_deep_function': ("""int p(n) { int i = 0; while (i < 30) { n = n * n; i = i + 1; }; n + """
+        + ' + '.join(['0'] * 250) + """; };
+print p(3) > 1; " "; print p(1); endl;
+""", ''),
+    'int_constant_folding': ("""print 99999999 * 99999999 * 99999999; endl;
+""", ''),
+
+# Программы глубже RECURSION_DEPTH_LIMIT не оптимизируются, но выводят числа так же
+    'deep_sum': ("int a = 1; print a + " + ' + '.join(['a'] * 299) + "; endl;\n", ''),
+    'deep_nested_ifs': ("int a = 1; " + "if (a) { " * 300 + "print a + a; endl; " + "}; " * 300 + "\n", ''),
+    'int_argument_in_deep_function': ("int f(n) { print n; \" \"; n + " + ' + '.join(['0'] * 250)
+        + "; };\nprint f(0); \" \"; print f(2); endl;\n", ''),
+}
+
+# Вывод программы без строк эха AST: на уровне 2 целые константы в нём без .0
+def run(source, inputs, engine, opt_level):
+    output = io.StringIO()
+    result = x3.compile(source, engine, opt_level).run(inputs, output)
+    lines = [line for line in output.getvalue().split('\n') if not line.startswith('AST:')]
+    return result, '\n'.join(lines)
+
+@pytest.mark.parametrize('opt_level', [0, 1, 2])
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('name', PROGRAMS)
+def test_engine_matches_tree(name, engine, opt_level):
+    source, inputs = PROGRAMS[name]
+    assert run(source, inputs, engine, opt_level) == run(source, inputs, 'tree', 0)
+
+# Ожидаемый вывод дерева на уровне 0 - эталона для остальных движков
+EXPECTED = {
+    'counted_loop': (True, "45.0 10.0\n"),
+    'counted_loop_float_bounds': (True, "14.0 8.5\n35.0 1.0\n"),
+    'loop_writes_bound': (True, "10.0 5.0\n"),
+    'short_circuit': (True, "0.0\n1.0\nTrue\n1.0 1.0\n2.0 2.0\n2.0\n"),
+    'recursion': (True, "610.0 400.0 81.0\n"),
+    'deep_recursion': (True, "1500.0 2400.0 2600.0\n"),
+    'pure_functions': (True, "190392490709135.0\n1.0 2.0 3.0 1.0 13.0\n"),
+    'function_locals': (True, "15.0 100.0\n"),
+    'index_out_of_bounds_column': (False, "0.0\nError : Array index out of bounds\n"),
+    'index_out_of_bounds_row': (False, "Error : Array index out of bounds\n"),
+    'index_negative_3d': (False, "0.0\nError : Array index out of bounds\n"),
+    'index_out_of_bounds_in_function': (False, "0.0\nError : Array index out of bounds\n"),
+    'int_squaring_overflow': (True, "True\ninf\n43046721.0\n3.4336838202925124e+30\n"),
+    'int_doubling_overflow': (True, "inf\n"),
+    'int_overflow_in_functions': (True, "4294967296.0\ninf\n1.9323349832288915e+244\n"),
+    'int_overflow_deep_function': (True, "True 1.0\n"),
+    'int_constant_folding': (True, "9.999999700000002e+23\n"),
+    'deep_sum': (True, "300.0\n"),
+    'deep_nested_ifs': (True, "2.0\n"),
+    'int_argument_in_deep_function': (True, "0.0 0.0 2.0 2.0\n"),
+}
+
+@pytest.mark.parametrize('name', EXPECTED)
+def test_reference_output(name):
+    source, inputs = PROGRAMS[name]
+    assert run(source, inputs, 'tree', 0) == EXPECTED[name]
+
+# Вид циклов while в программе после оптимизации
+def loop_kinds(source, opt_level):
+    program = x3.compile(source, 'tree', opt_level).program
+    kinds = []
+    stack = list(program)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, WhileExprAST):
+            kinds.append(type(node).__name__)
+        for name in slot_names(type(node)):
+            value = getattr(node, name, None)
+            if isinstance(value, ExprAST):
+                stack.append(value)
+            elif isinstance(value, tuple):
+                stack.extend(item for item in value if isinstance(item, ExprAST))
+    return set(kinds)
+
+@pytest.mark.parametrize('name, counted', [
+    ('counted_loop', True),
+    ('counted_loop_float_bounds', True),
+    ('counted_loop_variable_bounds', True),
+    ('loop_writes_bound', False),
+    ('loop_writes_counter', False),
+])
+def test_counted_loop_rewrite(name, counted):
+    source, _ = PROGRAMS[name]
+    assert loop_kinds(source, 0) == {'WhileExprAST'}
+    expected = 'CountedWhileExprAST' if counted else 'WhileExprAST'
+    assert loop_kinds(source, 1) == loop_kinds(source, 2) == {expected}
+
+# Число индексов не совпадает с числом измерений - ошибка разбора. Один индекс
+# (позиция в плоском буфере) ошибкой не является и здесь не проверяется.
+@pytest.mark.parametrize('source', [
+    "int m[2][2]; m[1][1][1];",
+    "int t[2][2][2]; t[1][1];",
+    "int m[2][2]; m[0][0] = m[1][1][0];",
+])
+def test_wrong_number_of_indexes(source):
+    with pytest.raises(RuntimeError, match="Wrong number of indexes"):
+        x3.compile(source)
+
+# Эхо значений в REPL после программы, собранной на уровне 2 (в ней целые числа)
+@pytest.mark.parametrize('engine', REPL_ENGINES)
+def test_repl_echo_formats_integers(engine, tmp_path, monkeypatch):
+    path = tmp_path / 'program.X3'
+    path.write_text("int a = 2;\n")
+    lines = iter(["a;", "a + 1; print a; endl;"])
+    def read_line(prompt):
+        for line in lines:
+            return line
+        raise EOFError
+    monkeypatch.setattr('builtins.input', read_line)
+    output = io.StringIO()
+    state = output_sink.save()
+    output_sink.configure(output, 'exit', quiet=True)
+    try:
+        Interpreter(engine=engine, opt_level=2).repl(str(path))
+        output_sink.flush()
+    finally:
+        output_sink.restore(state)
+    assert output.getvalue() == "2.0\n3.0\n2.0\n\n"
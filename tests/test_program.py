@@ -0,0 +1,56 @@
+import io
+import threading
+import pytest
+import x3
+from output import output_sink
+from inputs import input_reader
+from main import Function
+
+def test_run_restores_output_and_input():
+    program = x3.compile("int x = 0; read x; print x * 2; endl;")
+    stream = output_sink.stream
+    input_stream = input_reader.stream
+    output_sink.write("pending")
+    try:
+        output = io.StringIO()
+        assert program.run("21", output)
+        assert output.getvalue() == "42.0\n"
+        assert output_sink.stream is stream
+        assert output_sink.parts == ["pending"]
+        assert input_reader.stream is input_stream
+    finally:
+        output_sink.take()
+
+def test_runs_from_threads_do_not_mix_output():
+    programs = [x3.compile(f"int i = 0; int s = 0; while (i < 5000) {{ s = s + {k}; i = i + 1; }}; print s; endl;",
+                           engine=engine)
+                for k, engine in enumerate(['tree', 'vm', 'closure', 'python'] * 2)]
+    outputs = [io.StringIO() for _ in programs]
+    threads = [threading.Thread(target=program.run, args=('', output)) for program, output in zip(programs, outputs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [output.getvalue() for output in outputs] == [f"{k * 5000.0}\n" for k in range(len(programs))]
+
+def test_call_nesting_is_per_thread():
+    Function.nesting.depth = 150  # Как будто этот поток глубоко в рекурсии
+    try:
+        depths = []
+        thread = threading.Thread(target=lambda: depths.append(Function.nesting.depth))
+        thread.start()
+        thread.join()
+        assert depths == [0]
+        assert Function.nesting.depth == 150
+    finally:
+        Function.nesting.depth = 0
+
+@pytest.mark.parametrize('engine', ['tree', 'vm', 'closure', 'python'])
+def test_run_starts_with_empty_pure_caches(engine):
+    program = x3.compile("""pure int f(n) { print n; " "; n * 2; };
+print f(1) + f(1); endl;
+""", engine)
+    for _ in range(2):
+        output = io.StringIO()
+        assert program.run('', output)
+        assert output.getvalue() == "1.0 4.0\n"
@@ -0,0 +1,31 @@
+from types import GeneratorType
+
+# Наибольшая глубина AST, которую обходят рекурсивно (evaluate(), compile(),
+# оптимизатор). Выражения глубже исполняются на VM, байткод для которой
+# генерируется без рекурсии Python.
+RECURSION_DEPTH_LIMIT = 200
+
+# Выполняет рекурсивный обход на явном стеке вместо стека вызовов Python.
+# Метод-генератор вместо вложенного вызова выдаёт через yield вызов для
+# дочернего узла (генератор или уже готовое значение) и получает его результат;
+# результат генератора - значение его return. Поэтому глубина разбираемых
+# программ ограничена только памятью, а не пределом рекурсии Python.
+def trampoline(call):
+    if not isinstance(call, GeneratorType):
+        return call
+    stack = [call]
+    value = None
+    while True:
+        try:
+            call = stack[-1].send(value)
+        except StopIteration as stop:
+            stack.pop()
+            if not stack:
+                return stop.value
+            value = stop.value
+            continue
+        if isinstance(call, GeneratorType):
+            stack.append(call)
+            value = None
+        else:
+            value = call
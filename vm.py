@@ -0,0 +1,340 @@
+from array import array
+from functools import partial
+from lexer import *
+from arrays import new_array, array_offset
+from output import output_sink, format_value
+from inputs import input_reader, InputPending
+from memo import MISSING
+from optimizer import bounded_int
+from trampoline import trampoline
+
+# Коды операций байткода.
+# Операнды (если есть) записываются в код сразу после операции.
+OP_CONST = 1         # const_index: положить константу на стек
+OP_STRING = 2        # const_index: вывести строку и положить ""
+OP_LOAD = 3          # slot: положить значение переменной
+OP_STORE = 4         # slot: записать вершину стека в переменную
+OP_LOAD_ELEM = 5     # slot: снять индекс, положить элемент массива
+OP_STORE_ELEM = 6    # slot: снять индекс, записать в массив значение под ним
+OP_NEW_ARRAY = 7     # slot, size: объявить массив, положить 0.0
+OP_ADD = 8
+OP_SUB = 9
+OP_MUL = 10
+OP_DIV = 11
+OP_EQ = 12
+OP_NE = 13
+OP_LT = 14
+OP_LE = 15
+OP_GT = 16
+OP_GE = 17
+OP_JUMP_IF_FALSE_OR_POP = 18  # target: если вершина стека ложна, перейти, оставив её; иначе снять
+OP_JUMP_IF_TRUE_OR_POP = 19   # target: если вершина стека истинна, перейти, оставив её; иначе снять
+OP_POP = 20
+OP_JUMP = 21         # target
+OP_JUMP_IF_FALSE = 22  # target: снять значение и перейти, если оно ложно
+OP_PRINT = 23        # вывести вершину стека (format_value), оставив её на стеке
+OP_ENDL = 24         # вывести перевод строки, положить 0.0
+OP_INPUT = 25        # slot: прочитать число в переменную и положить его
+OP_RETURN = 26       # завершить выполнение, вернуть вершину стека
+OP_INPUT_ARRAY = 27  # slot: заполнить массив числами из ввода, положить 0.0
+OP_CALL = 28         # const_index, count: снять count аргументов, вызвать функцию-константу, положить результат
+OP_LOOP = 29         # target: как OP_JUMP в конец цикла, но расходует одну итерацию кванта (см. VM.run)
+OP_INVOKE = 30       # const_index, count: снять count аргументов и вызвать функцию программы (Function)
+OP_OFFSET = 31       # const_index: снять по индексу на измерение формы-константы, положить смещение элемента
+OP_OFFSET_2D = 32    # rows, columns: то же для двумерного массива, без таблицы констант
+OP_BOUND_INT = 33    # const_index: целое на вершине стека больше константы по модулю заменить на float (bounded_int)
+
+# Признак приостановленного исполнения, который возвращает VM.run
+SUSPENDED = object()
+
+# Наибольшая глубина вложенных вызовов функций
+CALL_DEPTH_LIMIT = 100000
+
+# Соответствие бинарных операторов парсера кодам операций
+BINARY_OPCODES = {
+    ord('+'): OP_ADD,
+    ord('-'): OP_SUB,
+    ord('*'): OP_MUL,
+    ord('/'): OP_DIV,
+    TOKEN_EQ: OP_EQ,
+    TOKEN_NE: OP_NE,
+    TOKEN_LT: OP_LT,
+    TOKEN_LE: OP_LE,
+    TOKEN_GT: OP_GT,
+    TOKEN_GE: OP_GE,
+}
+
+# Байткод одной единицы компиляции: операции с операндами и таблица констант
+class Code:
+    # sliced - код для исполнения по частям (aio.py): циклы заканчиваются OP_LOOP
+    def __init__(self, sliced=False):
+        self.ops = array('i')
+        self.consts = []
+        self.sliced = sliced
+
+    def emit(self, *ops):
+        self.ops.extend(ops)
+        return len(self.ops) - 1  # Позиция последнего операнда, для patch
+
+    def position(self):
+        return len(self.ops)
+
+    def patch(self, operand_position, target):
+        self.ops[operand_position] = target
+
+    def constant(self, value):
+        self.consts.append(value)
+        return len(self.consts) - 1
+
+# Байткод выражения верхнего уровня
+def compile_code(ast, sliced=False):
+    code = Code(sliced)
+    trampoline(ast.emit(code))
+    code.emit(OP_RETURN)
+    return code
+
+# Стековая виртуальная машина.
+# Переменные хранятся в кадре frame по номерам ячеек, назначенным при разрешении имён.
+# Функции программы VM вызывает сама, без рекурсии Python: OP_INVOKE сохраняет
+# код, позицию и кадр вызывающего в стеке вызовов calls и переходит к байткоду
+# тела с новым кадром, а OP_RETURN в теле возвращается к вызывающему.
+# output и reader - вывод и источник чисел для read (по умолчанию общие
+# output_sink и input_reader; у каждой программы в aio.py свои).
+class VM:
+    def __init__(self, frame, output=None, reader=None):
+        self.frame = frame
+        self.output = output_sink if output is None else output
+        self.reader = input_reader if reader is None else reader
+        self.state = None  # (code, pc, stack, frame, calls) приостановленного исполнения
+        self.ticks = 0  # Остаток кванта итераций после последнего run
+        self.waiting_input = False  # Исполнение приостановлено до поступления ввода
+
+    def execute(self, ast):
+        return self.prepare(ast)()
+
+    # Компилирует выражение в байткод; возвращает функцию без аргументов, исполняющую его
+    def prepare(self, ast):
+        return partial(self.run, compile_code(ast))
+
+    # Исполняет код с позиции pc над стеком stack. В коде sliced каждая
+    # итерация цикла (OP_LOOP) и каждый вызов функции (OP_INVOKE) расходуют
+    # один из ticks; когда они кончаются
+    # или ввода для read пока нет (InputPending), исполнение приостанавливается:
+    # возвращается SUSPENDED, а продолжает его resume()
+    def run(self, code, pc=0, stack=None, ticks=-1, frame=None, calls=None):
+        if frame is None:
+            frame = self.frame
+        ops = code.ops.tolist()
+        consts = code.consts
+        if stack is None:
+            stack = []
+        if calls is None:
+            calls = []  # (code, ops, consts, frame, pc, cache, args) вызывающих
+        push = stack.append
+        pop = stack.pop
+        output = self.output
+        write = output.write
+        reader = self.reader
+        self.waiting_input = False
+        try:
+            while True:
+                op = ops[pc]
+                if op == OP_LOAD:
+                    push(frame[ops[pc + 1]])
+                    pc += 2
+                elif op == OP_CONST:
+                    push(consts[ops[pc + 1]])
+                    pc += 2
+                elif op == OP_LOAD_ELEM:
+                    array_value = frame[ops[pc + 1]]
+                    idx = int(pop())
+                    if 0 <= idx < len(array_value):
+                        push(array_value[idx])
+                    else:
+                        raise IndexError("Array index out of bounds")
+                    pc += 2
+                elif op == OP_OFFSET_2D:
+                    column = pop()
+                    row = int(stack[-1])
+                    if 0 <= row < ops[pc + 1]:
+                        column = int(column)
+                        columns = ops[pc + 2]
+                        if 0 <= column < columns:
+                            stack[-1] = row * columns + column
+                            pc += 3
+                            continue
+                    raise IndexError("Array index out of bounds")
+                elif op == OP_JUMP_IF_FALSE:
+                    if pop():
+                        pc += 2
+                    else:
+                        pc = ops[pc + 1]
+                elif op == OP_POP:
+                    pop()
+                    pc += 1
+                elif op == OP_JUMP:
+                    pc = ops[pc + 1]
+                elif op == OP_ADD:
+                    right = pop()
+                    stack[-1] = stack[-1] + right
+                    pc += 1
+                elif op == OP_SUB:
+                    right = pop()
+                    stack[-1] = stack[-1] - right
+                    pc += 1
+                elif op == OP_LT:
+                    right = pop()
+                    stack[-1] = stack[-1] < right
+                    pc += 1
+                elif op == OP_GT:
+                    right = pop()
+                    stack[-1] = stack[-1] > right
+                    pc += 1
+                elif op == OP_STORE:
+                    frame[ops[pc + 1]] = stack[-1]
+                    pc += 2
+                elif op == OP_STORE_ELEM:
+                    array_value = frame[ops[pc + 1]]
+                    idx = int(pop())
+                    if 0 <= idx < len(array_value):
+                        array_value[idx] = stack[-1]
+                    else:
+                        raise IndexError("Array index out of bounds")
+                    pc += 2
+                elif op == OP_MUL:
+                    right = pop()
+                    stack[-1] = stack[-1] * right
+                    pc += 1
+                elif op == OP_DIV:
+                    right = pop()
+                    if right == 0:
+                        raise ZeroDivisionError("Division by zero")
+                    stack[-1] = stack[-1] / right
+                    pc += 1
+                elif op == OP_LE:
+                    right = pop()
+                    stack[-1] = stack[-1] <= right
+                    pc += 1
+                elif op == OP_GE:
+                    right = pop()
+                    stack[-1] = stack[-1] >= right
+                    pc += 1
+                elif op == OP_EQ:
+                    right = pop()
+                    stack[-1] = stack[-1] == right
+                    pc += 1
+                elif op == OP_NE:
+                    right = pop()
+                    stack[-1] = stack[-1] != right
+                    pc += 1
+                elif op == OP_JUMP_IF_FALSE_OR_POP:
+                    if stack[-1]:
+                        pop()
+                        pc += 2
+                    else:
+                        pc = ops[pc + 1]
+                elif op == OP_JUMP_IF_TRUE_OR_POP:
+                    if stack[-1]:
+                        pc = ops[pc + 1]
+                    else:
+                        pop()
+                        pc += 2
+                elif op == OP_NEW_ARRAY:
+                    frame[ops[pc + 1]] = new_array(ops[pc + 2])
+                    push(0.0)
+                    pc += 3
+                elif op == OP_PRINT:
+                    write(format_value(stack[-1]))
+                    pc += 1
+                elif op == OP_STRING:
+                    write(consts[ops[pc + 1]])
+                    push("")
+                    pc += 2
+                elif op == OP_ENDL:
+                    output.line()
+                    push(0.0)
+                    pc += 1
+                elif op == OP_INPUT:
+                    value = reader.read_number()
+                    frame[ops[pc + 1]] = value
+                    push(value)
+                    pc += 2
+                elif op == OP_INPUT_ARRAY:
+                    reader.read_into(frame[ops[pc + 1]])
+                    push(0.0)
+                    pc += 2
+                elif op == OP_CALL:
+                    count = ops[pc + 2]
+                    args = stack[len(stack) - count:]
+                    del stack[len(stack) - count:]
+                    push(consts[ops[pc + 1]](*args))
+                    pc += 3
+                elif op == OP_BOUND_INT:
+                    value = stack[-1]
+                    if type(value) is int:
+                        stack[-1] = bounded_int(value, consts[ops[pc + 1]])
+                    pc += 2
+                elif op == OP_LOOP:
+                    pc = ops[pc + 1]
+                    ticks -= 1
+                    if ticks == 0:
+                        self.state = (code, pc, stack, frame, calls)
+                        self.ticks = 0
+                        return SUSPENDED
+                elif op == OP_OFFSET:
+                    shape = consts[ops[pc + 1]]
+                    count = len(shape)
+                    indexes = stack[len(stack) - count:]
+                    del stack[len(stack) - count:]
+                    push(array_offset(shape, indexes))
+                    pc += 2
+                elif op == OP_INVOKE:
+                    function = consts[ops[pc + 1]]
+                    count = ops[pc + 2]
+                    args = tuple(stack[len(stack) - count:])
+                    del stack[len(stack) - count:]
+                    pc += 3
+                    cache = function.cache
+                    value = MISSING if cache is None else cache.get(args)
+                    if value is not MISSING:
+                        push(value)
+                    else:
+                        if len(calls) >= CALL_DEPTH_LIMIT:
+                            raise RuntimeError("Call stack overflow")
+                        calls.append((code, ops, consts, frame, pc, cache, args))
+                        code = function.code(code.sliced)
+                        ops = code.ops.tolist()
+                        consts = code.consts
+                        frame = [*args, *function.padding]
+                        pc = 0
+                    # Вызов, как и итерация цикла, расходует одну итерацию кванта:
+                    # рекурсия без циклов тоже отдаёт управление
+                    if code.sliced:
+                        ticks -= 1
+                        if ticks == 0:
+                            self.state = (code, pc, stack, frame, calls)
+                            self.ticks = 0
+                            return SUSPENDED
+                elif op == OP_RETURN:
+                    if calls:
+                        # Значение тела функции остаётся на стеке результатом вызова
+                        code, ops, consts, frame, pc, cache, args = calls.pop()
+                        if cache is not None:
+                            cache.put(args, stack[-1])
+                        continue
+                    self.ticks = ticks
+                    return pop()
+                else:
+                    raise RuntimeError(f"Unknown opcode: {op}")
+        except InputPending:
+            # Операция чтения ещё ничего не изменила: pc указывает на неё
+            self.state = (code, pc, stack, frame, calls)
+            self.ticks = ticks
+            self.waiting_input = True
+            return SUSPENDED
+
+    # Продолжает приостановленное исполнение
+    def resume(self, ticks=-1):
+        code, pc, stack, frame, calls = self.state
+        self.state = None
+        return self.run(code, pc, stack, ticks, frame, calls)
@@ -0,0 +1,12 @@
+from main import Program, set_array_backend
+
+# Программный интерфейс X3 для встраивания в приложения на Python:
+#
+#     import x3
+#     program = x3.compile(source)
+#     program.run("1 2 3", output)
+#
+# Текст разбирается и подготавливается к исполнению один раз; каждый запуск
+# run() начинается с чистого состояния переменных и пустых кешей функций pure.
+def compile(source, engine='tree', opt_level=0, lexer_mode='fast'):
+    return Program(source, engine, opt_level, lexer_mode)